@@ -43,22 +43,133 @@ def Permission(id, name="", description=""):
 def Role(id, name="", description=""):
     return droleRole.create(id, name, description)
 
-def assign_perms(instance, permdict):
-    """ invoked by a signal handler upon creation: Set initial
-        permissions """
+def ident(value):
+    """ the id of a drole Role/Permission; values_list() doesn't convert
+        to drole types """
+    return getattr(value, 'id', value)
+
+def bulk_assign(instance, permdict, existing=()):
+    """ insert the assignments in permdict that are not among the
+        existing (permission id, role id) pairs, in a single query """
+    from django.contrib.contenttypes.models import ContentType
+
+    model_ct = ContentType.objects.get_for_model(instance)
+    seen = set(existing)
+    assignments = []
     for permission, roles in permdict.iteritems():
         for role in roles:
-            RolePermission.assign(instance, role, permission).save()
+            key = (ident(permission), ident(role))
+            if key in seen:
+                continue
+            seen.add(key)
+            assignments.append(RolePermission(content_type=model_ct,
+                                              object_id=instance.pk,
+                                              permission=permission,
+                                              role=role))
+    if assignments:
+        RolePermission.objects.bulk_create(assignments)
+    return bool(assignments)
+
+def assignments_changed():
+    """ bulk inserts and deletes don't send the signals the page cache
+        relies on """
+    from .pagecache import page_cache
+    page_cache.invalidate()
+
+def assign_perms(instance, permdict, new=False):
+    """ invoked by a signal handler upon creation: Set initial
+        permissions. Existing assignments are kept; a new instance has
+        none, so they're not looked up and permdict is all there is """
+    existing = ()
+    if not new:
+        existing = [(ident(p), ident(r)) for (p, r) in
+                    RolePermission.assignments(instance).values_list(
+                        'permission', 'role')]
+    if bulk_assign(instance, permdict, existing):
+        assignments_changed()
+    update_summary(instance, permdict, complete=new)
 
 def update_perms(instance, permdict):
-    for permission, roles in permdict.iteritems():
-        RolePermission.clear(instance, permission)
-        for role in roles:
-            RolePermission.assign(instance, role, permission).save()
+    RolePermission.assignments(instance).filter(
+        permission__in=[ident(p) for p in permdict]).delete()
+    bulk_assign(instance, permdict)
+    assignments_changed()
+    update_summary(instance, permdict)
 
-def get_roles_in_context(request, type, spoke=None):
-    ## check roles for request.user and their group(s), local roles, owner role
+def update_summary(instance, permdict=None, complete=False):
+    """
+        Content keeps a summary of its assignments: whether anonymous
+        visitors may view it (anonymous_view), which answers the most
+        common permission check without RolePermission lookups. Update it
+        after changing the assignments (in permdict, if known) of instance.
+        If permdict holds all of them (complete), there's no need to look
+        them up.
+    """
+    from wheelcms_axle.content import ContentBase
+    from wheelcms_axle import roles, permissions
+
+    if not isinstance(instance, ContentBase) or not instance.pk:
+        return
+
+    if complete:
+        anonymous_view = roles.anonymous in \
+                         permdict.get(permissions.view_content, ())
+        if anonymous_view == instance.anonymous_view:
+            ## as just stored
+            return
+    elif permdict is not None and permissions.view_content not in permdict:
+        return
+    else:
+        anonymous_view = RolePermission.assignments(instance).filter(
+                             permission=permissions.view_content,
+                             role=roles.anonymous).exists()
+    instance.anonymous_view = anonymous_view
+    ## update the table holding the field directly
+    model = instance._meta.get_field('anonymous_view').model
+    model._default_manager.filter(pk=instance.pk
+                                  ).update(anonymous_view=anonymous_view)
+    ## update() doesn't send post_save either
+    assignments_changed()
+
+def summarized(request, spoke, permission):
+    """
+        The answer to an anonymous view_content check according to the
+        content's summary, None if the summary doesn't apply. Anonymous
+        visitors have no local roles, so the summary is all there is.
+    """
+    from wheelcms_axle import permissions
+
+    if request.user.is_authenticated() or \
+       permission != permissions.view_content or \
+       not (spoke and spoke.instance):
+        return None
+    return spoke.instance.anonymous_view
+
+def role_cache(request):
+    """
+        The roles resolved so far, kept on the request so they're resolved
+        once per request (and instance). It's tied to the user, which may
+        change within a request (e.g. when logging in)
+    """
+    cache = getattr(request, '_wheel_roles', None)
+    user = getattr(request.user, 'pk', None)
+    if cache is None or cache['user'] != user:
+        cache = request._wheel_roles = dict(user=user, globals=None,
+                                            locals={})
+    return cache
+
+def forget_roles(request):
+    """ drop the cached roles, e.g. after (re)assigning roles """
+    request._wheel_roles = None
+
+def global_roles(request):
+    """ the roles of request.user and their group(s), regardless of
+        context """
     from wheelcms_axle import roles
+    cache = role_cache(request)
+    if cache['globals'] is not None:
+        return cache['globals']
+
     r = [roles.anonymous]
     if request.user.is_authenticated():
         r.append(roles.member)
@@ -66,13 +177,30 @@ def get_roles_in_context(request, type, spoke=None):
 
         for g in request.user.groups.all():
             r.extend(r.role for r in g.roles.all())
+    cache['globals'] = frozenset(r)
+    return cache['globals']
+
+def get_roles_in_context(request, type, spoke=None):
+    ## check roles for request.user and their group(s), local roles, owner role
+    from wheelcms_axle import roles
+    r = set(global_roles(request))
 
-        if spoke and spoke.instance and spoke.instance.owner == request.user:
-            r.append(roles.owner)
+    if not request.user.is_authenticated():
+        return r
 
-        r.extend(local_roles(spoke, request=request, lookup=lr))
+    cache = role_cache(request)
+    instance = spoke and spoke.instance
+    key = instance and instance.pk
+    if key and key in cache['locals']:
+        return r | cache['locals'][key]
 
-    return set(r)
+    local = set(local_roles(spoke, request=request, lookup=lr))
+    if instance and instance.owner_id == request.user.pk:
+        local.add(roles.owner)
+
+    if key:
+        cache['locals'][key] = frozenset(local)
+    return r | local
 
 import reg
 @reg.generic
@@ -96,6 +224,10 @@ def has_access(request, type, spoke, permission):
     if request.user.is_active and request.user.is_superuser:
         return True
 
+    summary = summarized(request, spoke, permission)
+    if summary is not None:
+        return summary
+
     roles = get_roles_in_context(request, type, spoke)
     if spoke and spoke.instance:
         for role in roles:
@@ -115,3 +247,108 @@ def has_access(request, type, spoke, permission):
         return True
 
     return False
+
+def has_access_many(request, spokes, permission=None):
+    """
+        The spokes (in order) request.user has permission on, like
+        has_access but loading the relevant role assignments of all
+        spokes in a single query. Without permission, each spoke's own
+        "view" permission is required.
+    """
+    from django.contrib.contenttypes.models import ContentType
+
+    spokes = list(spokes)
+
+    def required(spoke):
+        return permission or spoke.permissions.get('view')
+
+    if request.user.is_active and request.user.is_superuser:
+        return spokes
+
+    if request.user.is_authenticated() and not request.user.is_active:
+        return [spoke for spoke in spokes if required(spoke) == public]
+
+    pending = [spoke for spoke in spokes
+               if spoke and spoke.instance and required(spoke) != public and
+                  summarized(request, spoke, required(spoke)) is None]
+    granted = {}
+    if pending:
+        assignments = RolePermission.objects.filter(
+                          object_id__in=set(s.instance.pk for s in pending),
+                          permission__in=set(ident(required(s))
+                                             for s in pending)
+                      ).values_list('content_type', 'object_id',
+                                    'permission', 'role')
+        for ct, object_id, perm, role in assignments:
+            granted.setdefault((ct, object_id, ident(perm)),
+                               set()).add(ident(role))
+
+    accessible = []
+    for spoke in spokes:
+        perm = required(spoke)
+        summary = summarized(request, spoke, perm)
+        if perm == public or summary:
+            accessible.append(spoke)
+        elif summary is not None:
+            continue
+        elif not (spoke and spoke.instance):
+            if has_access(request, spoke, spoke, perm):
+                accessible.append(spoke)
+        else:
+            ct = ContentType.objects.get_for_model(spoke.instance).pk
+            roles = get_roles_in_context(request, spoke, spoke)
+            ## Don't fallback to global / "Spoke level" assignments
+            if set(r.id for r in roles) & \
+               granted.get((ct, spoke.instance.pk, ident(perm)), set()):
+                accessible.append(spoke)
+    return accessible
+
+def content_types():
+    """ the ids of the content types of all content models """
+    from django.contrib.contenttypes.models import ContentType
+    from django.db.models import get_models
+    from wheelcms_axle.content import ContentBase
+
+    models = [m for m in get_models() if issubclass(m, ContentBase)]
+    return [ct.pk for ct in
+            ContentType.objects.get_for_models(*models).values()]
+
+def accessible_q(request, permission=None, prefix=""):
+    """
+        A Q object selecting the content request.user has permission
+        (by default view_content) on, to be resolved by the database
+        through a subquery on the role assignments. prefix is the path
+        to the content, e.g. "contentbase__" for nodes.
+
+        Unlike has_access only global roles and ownership are taken into
+        account, local_roles can't be expressed as a query.
+    """
+    from django.db.models import Q
+    from wheelcms_axle import roles, permissions
+
+    permission = permission or permissions.view_content
+
+    if permission == public or \
+       (request.user.is_active and request.user.is_superuser):
+        return Q()
+
+    if request.user.is_authenticated() and not request.user.is_active:
+        return Q(**{prefix + "pk__in": []})
+
+    def granted(held):
+        return RolePermission.objects.filter(
+                   content_type__in=content_types(),
+                   permission=permission,
+                   role__in=[role.id for role in held]
+               ).values('object_id')
+
+    if not request.user.is_authenticated() and \
+       permission == permissions.view_content:
+        ## resolved by the content's summary, see update_summary
+        return Q(**{prefix + "anonymous_view": True})
+
+    q = Q(**{prefix + "pk__in": granted(global_roles(request))})
+    if request.user.is_authenticated():
+        q |= Q(**{prefix + "owner": request.user,
+                  prefix + "pk__in": granted([roles.owner])})
+    return q
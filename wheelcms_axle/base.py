@@ -1,4 +1,5 @@
 from warnings import warn
+import functools
 import types
 from . import access
 
@@ -6,6 +7,22 @@ def context(f):
     f.contextified = True
     return f
 
+def memoize(f):
+    """
+        Remember the result of a handler method for the remainder of
+        the request, per instance and arguments
+    """
+    @functools.wraps(f)
+    def memoized(self, *args, **kw):
+        key = (f.__name__, getattr(getattr(self, 'instance', None), 'pk', None),
+               args, tuple(sorted(kw.items())))
+        try:
+            return self._memo[key]
+        except KeyError:
+            result = self._memo[key] = f(self, *args, **kw)
+            return result
+    return memoized
+
 class WheelHandlerMixin(object):
     def hasaccess(self):
         """ hasaccess is obsolete and should be replaced with a more
@@ -53,6 +70,7 @@ class WheelView(View):
         super(WheelView, self).__init__(*args, **kwargs)
         self.context = {}
         self.is_post = False
+        self._memo = {}
 
     ## special results
     @classmethod
@@ -103,12 +121,38 @@ class WheelView(View):
             url += "#" + hash
         raise Redirect(url, permanent=permanent)
 
+    @classmethod
+    def dispatch_tables(cls):
+        """
+            The @context methods and handlers of this class, scanned once
+            per (sub)class instead of on every request. Handlers map the
+            action name onto the attribute implementing it.
+        """
+        tables = cls.__dict__.get('_dispatch_tables')
+        if tables is None:
+            contextified = []
+            handlers = {}
+            for a in dir(cls):
+                if a in ("as_view", ):
+                    continue  ## django won't even let us look at these!
+                m = getattr(cls, a, None)
+                if isinstance(m, (types.FunctionType, types.MethodType)) \
+                   and getattr(m, 'contextified', False):
+                    contextified.append(a)
+                if getattr(m, 'ishandler', False):
+                    handlers.setdefault(a, a)
+                if a.startswith("handle_"):
+                    ## handle_<name> takes precedence over @handler
+                    handlers[a[7:]] = a
+            tables = dict(context=tuple(contextified), handlers=handlers)
+            ## store on cls itself so subclasses get their own tables
+            cls._dispatch_tables = tables
+        return tables
+
     @classmethod
     def url_actions(cls):
-        ## add callable check?
-        return [x[7:] for x in dir(cls) if x.startswith("handle_")] + \
-               [x for x in dir(cls) if getattr(x, 'ishandler', False)]  + \
-               ["create", "edit"]
+        actions = sorted(cls.dispatch_tables()['handlers'])
+        return actions + [x for x in ("create", "edit") if x not in actions]
 
     def user(self):
         warn("WheelView.user() has been deprecated.", DeprecationWarning)
@@ -134,20 +178,15 @@ class WheelView(View):
     def setup_context(self):
         """ scan for "contextified" methods (using the @context decorator)
             and add those to self.context """
-        for a in dir(self):
-            if a in ("as_view", ):
-                continue  ## django won't even let us look at these!
-
-            m = getattr(self, a)
-            if isinstance(m, (types.FunctionType, types.MethodType)) and \
-               getattr(m, 'contextified', False):
-                self.context[a] = m
+        for a in self.dispatch_tables()['context']:
+            self.context[a] = getattr(self, a)
 
     def init_from_request(self, request):
         self.request = request
         self.is_post = request.method == "POST"
         self._user = request.user
         self.context = RequestContext(request)
+        self._memo = {}
         self.setup_context()
 
     def dispatch(self, request, *args, **kwargs):
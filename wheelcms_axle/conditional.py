@@ -0,0 +1,90 @@
+"""
+    Conditional GET support: compute ETag / Last-Modified validators and
+    answer If-None-Match / If-Modified-Since with a 304 before anything
+    expensive (such as rendering a template) happens
+"""
+import calendar
+import hashlib
+
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags, quote_etag, http_date, \
+                              parse_http_date_safe
+from django.contrib import messages
+
+try:
+    from django.http.response import HttpResponseBase
+except ImportError:
+    ## attempt to support Django 1.4
+    HttpResponseBase = HttpResponse
+
+
+def make_etag(*parts):
+    """ a (quoted) strong etag identifying the combination of parts """
+    raw = u"|".join(unicode(p) for p in parts)
+    return quote_etag(hashlib.md5(raw.encode('utf8')).hexdigest())
+
+def timestamp(dt):
+    """ seconds since the epoch, which is what HTTP dates resolve to """
+    return calendar.timegm(dt.utctimetuple())
+
+def is_current(request, etag=None, last_modified=None):
+    """
+        Do the request's validators identify the client's copy as current?
+        last_modified is in seconds since the epoch.
+
+        If-None-Match takes precedence over If-Modified-Since (RFC 7232).
+        Requests with pending messages are never current, the client's
+        copy can't contain them.
+    """
+    if request.method not in ("GET", "HEAD") or \
+       len(messages.get_messages(request)):
+        return False
+
+    if_none_match = request.META.get("HTTP_IF_NONE_MATCH")
+    if_modified_since = request.META.get("HTTP_IF_MODIFIED_SINCE")
+
+    if if_none_match and etag:
+        etags = parse_etags(if_none_match)
+        return '*' in etags or etag.strip('"') in etags
+    if if_modified_since and last_modified is not None:
+        since = parse_http_date_safe(if_modified_since)
+        return since is not None and last_modified <= since
+    return False
+
+def not_modified(request, etag=None, last_modified=None):
+    """
+        Return a 304 response if the client's copy is still current
+        according to the validators, else None
+    """
+    if not is_current(request, etag,
+                      last_modified and timestamp(last_modified)):
+        return None
+
+    response = HttpResponseNotModified()
+    set_validators(response, etag, last_modified)
+    return response
+
+def respond(request, response):
+    """
+        Replace a complete response carrying validators with a 304 if the
+        client's copy is still current
+    """
+    etag = response.get('ETag')
+    last_modified = parse_http_date_safe(response.get('Last-Modified', ''))
+    if not is_current(request, etag, last_modified):
+        return response
+
+    unchanged = HttpResponseNotModified()
+    for header in ('ETag', 'Last-Modified'):
+        if header in response:
+            unchanged[header] = response[header]
+    return unchanged
+
+def set_validators(response, etag=None, last_modified=None):
+    """ add the validators to response, if it is an actual response """
+    if isinstance(response, HttpResponseBase):
+        if etag:
+            response['ETag'] = etag
+        if last_modified:
+            response['Last-Modified'] = http_date(timestamp(last_modified))
+    return response
@@ -13,7 +13,9 @@ from .registry import Registry
 
 from .node import Node
 from .signals import state_changed
-from .utils import classproperty
+from .utils import classproperty, chunked
+## tracks file fields using content addressed storage as they're defined
+from .storage import ContentAddressedStorage
 
 class ContentException(Exception):
     pass
@@ -39,6 +41,25 @@ class ContentClass(models.Model):
         return "Content class %s" % self.name
 
 
+class ContentQuerySet(models.query.QuerySet):
+    def accessible_by(self, request, permission=None):
+        """
+            Only the content request.user has permission (by default
+            view_content) on, filtered by the database
+        """
+        from .auth import accessible_q
+        return self.filter(accessible_q(request, permission))
+
+
+class ContentManager(models.Manager):
+    def get_query_set(self):
+        """ Return the ContentQuerySet that supports additional filters """
+        return ContentQuerySet(self.model)
+
+    def accessible_by(self, request, permission=None):
+        return self.all().accessible_by(request, permission)
+
+
 class ContentBase(models.Model):
     CLASSES = ()
 
@@ -71,12 +92,17 @@ class ContentBase(models.Model):
     ## can be null for now, should move to null=False eventually
     owner = models.ForeignKey(User, null=True)
 
+    ## summary of the role/permission assignments, see auth.update_summary
+    anonymous_view = models.BooleanField(default=False, db_index=True)
+
     ## class..
     classes = models.ManyToManyField(ContentClass, related_name="content",
                                      blank=True)
 
     tags = TaggableManager(blank=True)
 
+    objects = ContentManager()
+
     ## explicit comment enable/disable
     discussable = models.NullBooleanField(blank=True, null=True, default=None)
 
@@ -89,6 +115,7 @@ class ContentBase(models.Model):
     def __init__(self, *args, **kwargs):
         super(ContentBase, self).__init__(*args, **kwargs)
         self._original_state = self.state
+        self._resolved_content = None
 
     @classmethod
     def construct_meta(cls, klass=None, parts=None):
@@ -148,7 +175,7 @@ class ContentBase(models.Model):
             self.classes.add(ContentClass.objects.get_or_create(name=klass)[0])
         return self  ## foo = x.save() is nice
 
-    def copy(self, node=None):
+    def copy(self, node=None, m2m=True):
         """ create a copy, attach it to new node if specified.
             content is copyable by default, but special measures must
             be taken with ManyToMany fields and fields with a unique=True
@@ -156,12 +183,25 @@ class ContentBase(models.Model):
 
             To disable copy support on a model set copyable = False
             (shouldn't this be defined at Spoke level? XXX)
+
+            If m2m is False, many to many relations are not copied;
+            the caller is expected to do so using copy_m2m()
         """
         if not self.copyable:
             raise ContentCopyNotSupported()
 
-        c = self.__class__.objects.get(pk=self.pk)
-        c.pk = c.id = None
+        ## clone the instance in stead of fetching it again
+        values = {}
+        for f in self._meta.fields:
+            value = getattr(self, f.attname)
+            if isinstance(f, models.FileField):
+                value = value.name
+            values[f.attname] = value
+        c = self.__class__(**values)
+
+        c.pk = None
+        for parent in c._meta.get_parent_list():
+            setattr(c, parent._meta.pk.attname, None)
         if node:
             c.node = node
 
@@ -171,11 +211,14 @@ class ContentBase(models.Model):
             ## most likely a unique field
             raise ContentCopyFailed(e.args[0])
 
-        for m2m in c._meta.many_to_many:
-            setattr(c, m2m.name, getattr(self, m2m.name).all())
+        if m2m:
+            copy_m2m([(self, c)])
         return c
 
     def content(self):
+        ## resolved in bulk by load_content()
+        if self._resolved_content is not None:
+            return self._resolved_content
         if self.meta_type:
             base = self
             for part in self.meta_type.split('/'):
@@ -210,6 +253,97 @@ class ContentBase(models.Model):
             return u"Unconnected %s: %s" % (self.meta_type, self.title)
 
 
+def copy_m2m(pairs):
+    """
+        Copy the many to many relations for a list of (original, copy)
+        pairs, replacing any relations the copies already have. Relations
+        through an automatically created table are copied with a single
+        bulk insert per relation and content type.
+    """
+    by_class = {}
+    for original, c in pairs:
+        by_class.setdefault(c.__class__, []).append((original, c))
+
+    for klass, pairs in by_class.iteritems():
+        for m2m in klass._meta.many_to_many:
+            through = m2m.rel.through
+            if through is None or not through._meta.auto_created:
+                for original, c in pairs:
+                    setattr(c, m2m.name, getattr(original, m2m.name).all())
+                continue
+
+            source = m2m.m2m_field_name()
+            target = m2m.m2m_reverse_field_name()
+            source_attname = through._meta.get_field(source).attname
+            target_attname = through._meta.get_field(target).attname
+
+            ## symmetrical relations are stored in both directions
+            symmetrical = m2m.rel.symmetrical and \
+                          issubclass(klass, m2m.rel.to)
+
+            copies = dict((original.pk, c.pk) for (original, c) in pairs)
+            links = []
+            for chunk in chunked(copies.keys(), 500):
+                copied = [copies[pk] for pk in chunk]
+                through.objects.filter(**{source + '__in': copied}).delete()
+                if symmetrical:
+                    through.objects.filter(**{target + '__in': copied}
+                                           ).delete()
+                for pk, target_pk in through.objects.filter(
+                                     **{source + '__in': chunk}
+                                     ).values_list(source, target):
+                    links.append(through(**{source_attname: copies[pk],
+                                            target_attname: target_pk}))
+                    if symmetrical:
+                        links.append(through(**{source_attname: target_pk,
+                                                target_attname: copies[pk]}))
+            for chunk in chunked(links, 500):
+                through.objects.bulk_create(chunk)
+
+
+def content_class(meta_type):
+    """ return the concrete Content class described by a meta_type """
+    klass = Content
+    for part in meta_type.split('/'):
+        klass = getattr(klass, part).related.model
+    return klass
+
+def resolve_content(bases):
+    """
+        Resolve Content instances into their concrete content using a
+        single query per content type. Returns a dict mapping pk to the
+        resolved content. Calling content() on the instances afterwards
+        won't query the database.
+    """
+    bytype = {}
+    for base in bases:
+        if base.meta_type:
+            bytype.setdefault(base.meta_type, []).append(base.pk)
+
+    resolved = {}
+    for meta_type, pks in bytype.iteritems():
+        manager = content_class(meta_type)._default_manager
+        for chunk in chunked(pks, 500):
+            for content in manager.filter(pk__in=chunk):
+                content._resolved_content = content
+                resolved[content.pk] = content
+
+    for base in bases:
+        if base.pk in resolved:
+            base._resolved_content = resolved[base.pk]
+    return resolved
+
+def load_content(bases):
+    """
+        Resolve a queryset or list of Content (or any of its subclasses)
+        into the concrete content, using a single query per content type.
+        Returns the concrete content in the original order.
+    """
+    bases = list(bases)
+    resolved = resolve_content(bases)
+    return [resolved.get(base.pk) for base in bases]
+
+
 WHEEL_CONTENT_BASECLASS = ContentBase
 
 
@@ -230,7 +364,7 @@ class FileContent(Content):
     FILECLASS = "wheel.file"
     CLASSES = Content.CLASSES + (FILECLASS, )
 
-    objects = models.Manager()
+    objects = ContentManager()
 
     @classproperty
     def instances(cls):
@@ -259,7 +393,11 @@ class FileContent(Content):
         self.filename = os.path.basename(self.filename)
 
         if not self.content_type:
-            type, encoding = mimetypes.guess_type(self.filename)
+            ## a new, streamed upload has been sniffed already
+            type = getattr(getattr(self.storage, '_file', None),
+                           'sniffed_type', None)
+            if type is None:
+                type, encoding = mimetypes.guess_type(self.filename)
             if type is None:
                 type = "application/octet-stream"
             self.content_type = type
@@ -270,7 +408,7 @@ class ImageContent(FileContent):
     IMAGECLASS = "wheel.image"
     CLASSES = FileContent.CLASSES + ("wheel.image", )
 
-    objects = models.Manager()
+    objects = ContentManager()
 
     @classproperty
     def instances(cls):
@@ -0,0 +1,165 @@
+"""
+    Delivery of stored files (e.g. FileSpoke.download)
+
+    By default files are streamed in chunks by the CMS itself, with support
+    for (single) HTTP Range requests. Set WHEEL_FILE_DELIVERY to offload the
+    actual transfer to the web server once the CMS has checked permissions:
+
+    - "sendfile": X-Sendfile (apache mod_xsendfile, lighttpd) with the
+      file's full path
+    - "accel": X-Accel-Redirect (nginx) to WHEEL_ACCEL_REDIRECT_PREFIX
+      (default "/protected/") followed by the file's storage name, which
+      should map onto an internal location serving MEDIA_ROOT
+    - the dotted path to a Delivery subclass
+"""
+import re
+import urllib
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.http import parse_http_date_safe
+from django.utils.importlib import import_module
+
+try:
+    from django.http import StreamingHttpResponse
+except ImportError:
+    ## attempt to support Django 1.4
+    StreamingHttpResponse = HttpResponse
+
+from .conditional import timestamp
+
+
+class Delivery(object):
+    """
+        Turns a stored file into a response. This is the interface
+        WHEEL_FILE_DELIVERY classes implement; StreamingDelivery is the
+        default implementation, the others fall back to it for files
+        they can't hand over to the web server.
+    """
+    def response(self, request, field, content_type, etag=None,
+                 last_modified=None):
+        """
+            Return the response delivering the stored file (a FieldFile)
+            with the given content type. Permissions have been checked
+            already. etag and last_modified are the file's
+            validators, which the caller adds to the response, and are
+            passed to evaluate If-Range.
+        """
+        raise NotImplementedError("%s must implement response()" %
+                                  self.__class__.__name__)
+
+class StreamingDelivery(Delivery):
+    """ stream the file from storage in chunks, honouring Range requests """
+    chunk_size = 64 * 1024
+
+    def chunks(self, field, start, length):
+        field.open('rb')
+        try:
+            field.seek(start)
+            while length > 0:
+                data = field.read(min(self.chunk_size, length))
+                if not data:
+                    break
+                length -= len(data)
+                yield data
+        finally:
+            field.close()
+
+    def byte_range(self, request, size, etag=None, last_modified=None):
+        """
+            The (start, end) requested by a single, satisfiable Range
+            header. None if the whole file should be sent, ValueError if
+            the range can't be satisfied.
+        """
+        header = request.META.get('HTTP_RANGE', '')
+        match = re.match(r'^bytes=(\d*)-(\d*)$', header.strip())
+        if not match or not any(match.groups()):
+            ## absent, malformed or multiple ranges: send it all
+            return None
+
+        if_range = request.META.get('HTTP_IF_RANGE')
+        if if_range:
+            since = parse_http_date_safe(if_range)
+            if since is None:
+                if if_range != etag:
+                    return None
+            elif last_modified is None or timestamp(last_modified) > since:
+                return None
+
+        first, last = match.groups()
+        if not first:
+            ## the last 'last' bytes
+            start, end = max(0, size - int(last)), size - 1
+        else:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+        if start >= size or start > end:
+            raise ValueError("Unsatisfiable range %s" % header)
+        return start, end
+
+    def response(self, request, field, content_type, etag=None,
+                 last_modified=None):
+        size = field.size
+        try:
+            byte_range = self.byte_range(request, size, etag, last_modified)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = 'bytes */%d' % size
+            return response
+
+        if byte_range is None:
+            start, end = 0, size - 1
+            response = StreamingHttpResponse(
+                            self.chunks(field, 0, size),
+                            content_type=content_type)
+        else:
+            start, end = byte_range
+            response = StreamingHttpResponse(
+                            self.chunks(field, start, end - start + 1),
+                            content_type=content_type, status=206)
+            response['Content-Range'] = 'bytes %d-%d/%d' % (start, end, size)
+
+        response['Content-Length'] = str(end - start + 1)
+        response['Accept-Ranges'] = 'bytes'
+        return response
+
+class XSendfileDelivery(Delivery):
+    """ let the web server send the file at its full path """
+    header = 'X-Sendfile'
+
+    def location(self, field):
+        return field.path
+
+    def response(self, request, field, content_type, etag=None,
+                 last_modified=None):
+        try:
+            location = self.location(field)
+        except NotImplementedError:
+            ## not stored on a filesystem the server can access
+            return StreamingDelivery().response(request, field, content_type,
+                                                etag, last_modified)
+        response = HttpResponse(content_type=content_type)
+        response[self.header] = location
+        return response
+
+class XAccelRedirectDelivery(XSendfileDelivery):
+    """ redirect nginx internally to the file's protected location """
+    header = 'X-Accel-Redirect'
+
+    def location(self, field):
+        prefix = getattr(settings, 'WHEEL_ACCEL_REDIRECT_PREFIX',
+                         '/protected/')
+        return prefix + urllib.quote(field.name.encode('utf8'))
+
+
+deliveries = dict(stream=StreamingDelivery,
+                  sendfile=XSendfileDelivery,
+                  accel=XAccelRedirectDelivery)
+
+def get_delivery():
+    """ the Delivery configured through WHEEL_FILE_DELIVERY """
+    name = getattr(settings, 'WHEEL_FILE_DELIVERY', 'stream')
+    if name in deliveries:
+        return deliveries[name]()
+    module, klass = name.rsplit('.', 1)
+    return getattr(import_module(module), klass)()
@@ -0,0 +1,118 @@
+"""
+    Scaled down renditions ("derivatives") of images for the img_content_*
+    size classes, so browsers don't download originals only to have css
+    scale them down.
+
+    Derivatives are generated on first request (through the +image/<size>
+    action) or in bulk using the "derivatives" management command, and
+    stored next to the originals under derivatives/<size>/<token>/. The
+    token changes whenever the original does, so a derivative never needs
+    to be invalidated and its url can be cached indefinitely.
+
+    The sizes (widths) can be configured with WHEEL_IMAGE_SIZES, a
+    sequence of (name, width) pairs matching the img_content_<name> classes.
+"""
+import hashlib
+import os
+from cStringIO import StringIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+
+from .storage import ContentAddressedStorage
+
+SIZES = (
+    ("thumb", 60),
+    ("small", 120),
+    ("medium", 250),
+    ("large", 400),
+)
+
+def sizes():
+    """ the available sizes, mapped onto their widths """
+    return dict(getattr(settings, 'WHEEL_IMAGE_SIZES', SIZES))
+
+def token(field):
+    """ identifies the version of the original """
+    raw = u"%s:%d" % (field.name, field.size)
+    return hashlib.md5(raw.encode('utf8')).hexdigest()[:12]
+
+def original_width(field):
+    """
+        The width of the original, remembered (by token, so per version)
+        so images too small to be scaled down are not opened again and
+        again. Only the image header is read.
+    """
+    from PIL import Image
+
+    key = "wheelcms_axle.derivatives.width.%s" % token(field)
+    width = cache.get(key)
+    if width is None:
+        field.open('rb')
+        try:
+            width = Image.open(field).size[0]
+        finally:
+            field.close()
+        cache.set(key, width, None)
+    return width
+
+def derivative_name(field, size):
+    return u"derivatives/%s/%s/%s" % (size, token(field),
+                                      os.path.basename(field.name))
+
+def derivative(field, size, force=False):
+    """
+        Return (a FieldFile for) the derivative of the image in field,
+        generating it if it doesn't exist yet. Images that are no wider
+        than size are never scaled up, the original is returned.
+    """
+    from PIL import Image
+
+    width = sizes()[size]
+    name = derivative_name(field, size)
+    storage = field.storage
+    if isinstance(storage, ContentAddressedStorage):
+        ## derivatives are found by name, not stored as blobs
+        storage = storage.plain()
+
+    if force or not storage.exists(name):
+        if original_width(field) <= width:
+            return field
+
+        field.open('rb')
+        try:
+            image = Image.open(field)
+            image.load()
+        finally:
+            field.close()
+
+        format = image.format or "PNG"
+        height = max(1, image.size[1] * width // image.size[0])
+        if format == "JPEG" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        elif image.mode == "P":
+            ## scale palette images with antialiasing
+            image = image.convert("RGBA")
+        image = image.resize((width, height), Image.ANTIALIAS)
+        if format == "GIF":
+            image = image.convert("P", palette=Image.ADAPTIVE)
+
+        data = StringIO()
+        options = dict(quality=85, optimize=True) if format == "JPEG" else {}
+        image.save(data, format, **options)
+        if force and storage.exists(name):
+            storage.delete(name)
+        name = storage.save(name, ContentFile(data.getvalue()))
+
+    return field.__class__(field.instance, field.field, name)
+
+def generate(field, force=False):
+    """ generate all derivatives of the image in field """
+    return dict((size, derivative(field, size, force=force))
+                for size in sizes())
+
+def url(instance, size):
+    """ the url of the +image action serving instance in size """
+    return u"%s+image/%s?v=%s" % (instance.get_absolute_url(), size,
+                                  token(instance.storage))
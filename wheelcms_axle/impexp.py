@@ -49,7 +49,7 @@ from django.utils.encoding import smart_unicode
 from django.contrib.auth.models import User
 from django.db.models import FileField
 
-from .content import type_registry
+from .content import type_registry, load_content
 from .node import Node
 from .registries.configuration import configuration_registry
 
@@ -205,10 +205,8 @@ class Exporter(object):
         nodetag = SubElement(parent, "node",
                              dict(id=str(node.pk), tree_path=node.tree_path))
 
-        for content in node.contentbase.all():
-            ## transform the baseclass into the actual instance
-            content = content.content()
-
+        ## transform the baseclasses into the actual instances
+        for content in load_content(node.contentbase.all()):
             spoke = content.spoke()
             type = spoke.model.get_name()
 
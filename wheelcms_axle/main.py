@@ -4,8 +4,9 @@ from django.template import loader, Context
 from django.http import HttpResponseServerError, HttpResponseNotFound, Http404
 from django.core.urlresolvers import resolve
 from django.contrib import messages
+from django.utils.datastructures import MultiValueDict
 
-from wheelcms_axle.node import Node, NodeNotFound, CantMoveToOffspring
+from wheelcms_axle.node import Node, CantMoveToOffspring
 from wheelcms_axle.content import type_registry, ImageContent
 
 from wheelcms_axle.spoke import FileSpoke, Spoke
@@ -26,8 +27,10 @@ from .actions import action_registry, tabaction
 from django.utils import translation
 from .models import WheelProfile
 from .toolbar import get_toolbar, Toolbar
-from .base import WheelView, context
+from .base import WheelView, context, memoize
 from .utils import applyrequest, json
+from .pagecache import page_cache
+from . import conditional, derivatives
 
 from wheelcms_axle import context_processors
 
@@ -98,13 +101,10 @@ def gethandler(h, name):
 
         XXX deprecate
     """
-    if hasattr(h, "handle_" + name):
-        return getattr(h, "handle_" + name)
-    if hasattr(h, name):
-        hh = getattr(h, name)
-        if getattr(hh, "ishandler", False):
-            return hh
-    return None
+    attr = h.dispatch_tables()['handlers'].get(name)
+    if attr is None:
+        return None
+    return getattr(h, attr)
 
 def handler(f):
     """ identify a method as being able to handle direct calls on a 
@@ -146,6 +146,20 @@ class MainHandler(WheelView):
         return Node.get(nodepath, language=language)
 
     def get(self, request, nodepath=None, handlerpath="", action="", **kw):
+        """ serve anonymous pages from the page cache, if enabled """
+        if handlerpath or not page_cache.cacheable(request):
+            return self.serve(request, nodepath, handlerpath, action, **kw)
+
+        key = page_cache.key(request, get_active_language(), nodepath or "",
+                             action.rstrip('/'))
+        response = page_cache.get(key)
+        if response is None:
+            response = self.serve(request, nodepath, handlerpath, action, **kw)
+            page_cache.set(key, request, response)
+            return response
+        return conditional.respond(request, response)
+
+    def serve(self, request, nodepath=None, handlerpath="", action="", **kw):
         """
             instance - the path to a piece of content
             path - remaining, specifies operation to be invoked.
@@ -181,8 +195,7 @@ class MainHandler(WheelView):
         ## retrieve content type info
         if spoke:
             ## update the context with addtional data from the spoke
-            self.context.update(spoke.context(self, self.request,
-                                self.instance))
+            self.context.update(self.spoke_context(spoke))
             perm = spoke.permissions.get('view')
         else:
             perm = Spoke.permissions.get('view')
@@ -198,8 +211,9 @@ class MainHandler(WheelView):
                 return self.notfound()
 
             if action:
-                action_handler = action_registry.get(action, self.instance.path,
-                                                 spoke)
+                ## actions may take arguments, e.g. +image/thumb
+                action_handler = action_registry.get(action.split('/', 1)[0],
+                                                     self.instance.path, spoke)
                 if action_handler is None:
                     return self.notfound()
                 ## Should the (decorator for) the action handler do permission checks?
@@ -234,10 +248,29 @@ class MainHandler(WheelView):
     def active_language(self):
         return get_active_language()
 
+    @memoize
+    def node_content(self, language):
+        """ the node's content in language, once per request """
+        if self.instance:
+            return self.instance.content(language=language)
+        return None
+
+    @memoize
+    def primary_content(self):
+        """ the node's primary content, once per request """
+        if self.instance:
+            return self.instance.primary_content()
+        return None
+
+    @memoize
+    def spoke_context(self, spoke):
+        """ the additional context provided by the spoke """
+        return spoke.context(self, self.request, self.instance)
+
     @context
     def body_class(self):
         if self.instance:
-            model = self.instance.primary_content()
+            model = self.primary_content()
 
             if model:
                 typename = model.get_name()
@@ -251,26 +284,31 @@ class MainHandler(WheelView):
     def page_title(self, language=None):
         """ return the content title, if any """
         language = language or self.active_language()
-        if self.instance:
-            content = self.instance.content(language=language)
-            if content:
-                return content.title
+        content = self.node_content(language)
+        if content:
+            return content.title
         return "Unattached node"
 
     @context
     def spoke(self, language=None):
         """ return type info for the current content, if any """
-        language = language or self.active_language()
-        if self.instance:
-            model = self.instance.content(language=language)
-            if model:
-                return model.spoke()
+        return self._spoke(language or self.active_language())
+
+    @memoize
+    def _spoke(self, language):
+        model = self.node_content(language)
+        if model:
+            return model.spoke()
         return None
 
     @context
     def tabs(self, spoke=None):
         """ return the tabs / actions the user has access to """
-        if not spoke and self.instance and self.instance.content():
+        return self._tabs(spoke)
+
+    @memoize
+    def _tabs(self, spoke):
+        if not spoke and self.node_content(self.active_language()):
             spoke = self.spoke()
 
         if spoke:
@@ -283,7 +321,7 @@ class MainHandler(WheelView):
     def content(self, language=None):
         """ return the actual content for the node / spoke """
         language = language or self.active_language()
-        modelinstance = self.instance.content(language=language)
+        modelinstance = self.node_content(language)
         if modelinstance:
             return modelinstance
         return None
@@ -310,7 +348,7 @@ class MainHandler(WheelView):
             else:
                 is_current = False
 
-            langcontent = self.instance.content(language=lang)
+            langcontent = self.instance.prefetched().content(language=lang)
             if langcontent:
                 url = langcontent.get_absolute_url()
                 has_translation = True
@@ -364,9 +402,12 @@ class MainHandler(WheelView):
     @classmethod
     def reserved(cls):
         ## XXX Can be mostly deprecated once handlers -> actions
-        return set(["create", "update", "list"] + \
-               [x[7:] for x in dir(cls) if x.startswith("handle_")] + \
-               [x for x in dir(cls) if getattr(getattr(cls, x), "ishandler", False)])
+        reserved = cls.__dict__.get('_reserved')
+        if reserved is None:
+            reserved = frozenset(["create", "update", "list"] +
+                                 cls.dispatch_tables()['handlers'].keys())
+            cls._reserved = reserved
+        return reserved
 
     def view(self):
         """ frontpage / view """
@@ -376,8 +417,7 @@ class MainHandler(WheelView):
 
         if spoke:
             ## update the context with addtional data from the spoke
-            self.context.update(spoke.context(self, self.request,
-                                self.instance))
+            self.context.update(self.spoke_context(spoke))
             perm = spoke.permissions.get('view')
         else:
             perm = Spoke.permissions.get('view')
@@ -388,12 +428,19 @@ class MainHandler(WheelView):
 
         if spoke:
             tpl = spoke.view_template()
+            etag, last_modified = self.validators(spoke, tpl)
+            unchanged = conditional.not_modified(self.request, etag,
+                                                 last_modified)
+            if unchanged:
+                return unchanged
+
             ctx = template_registry.context.get((spoke.__class__, tpl))
             if ctx:
                 self.context.update(ctx(self, self.request, self.instance))
 
-            return self.template(spoke.view_template())
-        elif self.instance.primary_content():
+            return conditional.set_validators(self.template(tpl),
+                                              etag, last_modified)
+        elif self.primary_content():
             """ attached but untranslated """
             if self.hasaccess():
                 return self.redirect(self.instance.get_absolute_url(language=language) + "edit",
@@ -406,6 +453,25 @@ class MainHandler(WheelView):
         return self.template("wheelcms_axle/nospoke.html")
 
 
+    def validators(self, spoke, template):
+        """
+            The ETag and Last-Modified of the view of spoke's content,
+            which depends on the content, language, template, the user
+            viewing it and their roles, and (through navigation and
+            listings) on the rest of the site
+        """
+        instance = spoke.instance
+        user = self.request.user
+        roles = sorted(r.id for r in
+                       auth.get_roles_in_context(self.request, spoke, spoke))
+        etag = conditional.make_etag(instance.pk, instance.modified,
+                                     self.active_language(), template,
+                                     user.pk if user.is_authenticated()
+                                     else None,
+                                     page_cache.site_generation(),
+                                     *roles)
+        return etag, instance.modified
+
     @handler
     @applyrequest
     def create(self, type=None, attach=False, *a, **b):
@@ -523,8 +589,7 @@ class MainHandler(WheelView):
 
         if self.spoke():
             ## update the context with addtional data from the spoke
-            self.context.update(self.spoke().context(self, self.request,
-                                self.instance))
+            self.context.update(self.spoke_context(self.spoke()))
 
 
         content = instance.content(language=language)
@@ -632,11 +697,10 @@ class MainHandler(WheelView):
             ## parent
             return []
 
-        parts = base.get_path(language=language).split("/")
+        nodes = base.ancestors(include_self=True, language=language)
         res = []
-        for i in range(len(parts)):
-            subpath = "/".join(parts[:i+1])
-            node = Node.get(subpath, language=language)
+        for i, node in enumerate(nodes):
+            subpath = node.get_path(language=language)
             content = node.content(language=language)
             primary_content = node.primary_content()
 
@@ -650,7 +714,7 @@ class MainHandler(WheelView):
 
             ## last entry should not get path
             if not operation:
-                if i == len(parts) - 1:
+                if i == len(nodes) - 1:
                     path = ""
 
             if node.isroot():
@@ -702,7 +766,7 @@ class MainHandler(WheelView):
 
         children = []
 
-        for child in self.instance.children():
+        for child in self.instance.children().with_content(active):
             c = dict(node=child, active=None, translations=[],
                      ipath=child.tree_path)
             for lang, langtitle in translate.languages():
@@ -715,7 +779,13 @@ class MainHandler(WheelView):
                 c['active'] = child.primary_content()
             children.append(c)
 
-        self.context['children'] = children
+        ## only list the children the user may view, checked all at once
+        allowed = set(spoke.instance.pk for spoke in
+                      auth.has_access_many(self.request,
+                          [c['active'].spoke() for c in children
+                           if c['active']]))
+        self.context['children'] = [c for c in children if not c['active']
+                                    or c['active'].pk in allowed]
 
         if spoke:
             return self.template(spoke.list_template())
@@ -757,6 +827,24 @@ class MainHandler(WheelView):
             self.instance.move(targetnode, before=referencenode)
         return dict(result="ok")
 
+    @json
+    def handle_reorder_children(self):
+        """ apply a complete new order to the children, specified as a
+            list of tree_paths """
+        if not self.hasaccess() or not self.is_post:
+            return self.forbidden()
+
+        ids = []
+        for tree_path in self.request.POST.getlist('order'):
+            parentpath, sep, id = tree_path.rpartition('/')
+            if not sep or parentpath != self.instance.tree_path or \
+               not id.isdigit():
+                return self.badrequest()
+            ids.append(int(id))
+
+        self.instance.reorder(ids)
+        return dict(result="ok")
+
     def handle_contents_actions_cutcopypaste(self):
         """ handle cut/copy/paste of items """
         if not self.hasaccess() or not self.is_post:
@@ -836,17 +924,14 @@ class MainHandler(WheelView):
 
         count = 0
         for p in self.request.POST.getlist('selection'):
-            n = Node.objects.get(tree_path=p)
+            try:
+                n = Node.objects.get(tree_path=p)
+            except Node.DoesNotExist:
+                ## should not happen but if it does, bag it and tag it
+                continue
             ## XXX recursively delete, or not, or detach...
-            if n:
-                try:
-                    n.parent().remove(n.slug())
-                except NodeNotFound:
-                    ## should not happen but if it does, bag it and tag it
-                    pass
-
-                n.delete()
-                count += 1
+            n.delete_subtree()
+            count += 1
 
         return self.redirect(self.instance.get_absolute_url() + 'list',
                              info="%d item(s) deleted" % count)
@@ -939,9 +1024,17 @@ class MainHandler(WheelView):
 
         propform = PropForm(initial=forminitial)
 
+        ## urls of scaled down versions, per size class
+        renditions = {}
+        if isinstance(instance, ImageContent):
+            renditions = dict(("img_content_" + size,
+                               derivatives.url(instance, size))
+                              for size in derivatives.sizes())
+
         return dict(initialdata=forminitial,
                     template=self.render_template("wheelcms_axle/popup_properties.html", spoke=spoke,
-                             instance=instance, mode=type, form=propform))
+                             instance=instance, mode=type, form=propform),
+                    derivatives=renditions)
 
     @json
     @applyrequest
@@ -1038,7 +1131,10 @@ class MainHandler(WheelView):
                                            ))
         upload = False
 
-        for i in range(2):
+        ## the start node and its ancestors, start node first
+        lineage = start.ancestors(include_self=True)[::-1]
+
+        for i, node in enumerate(lineage[:2]):
             content = node.content()
 
             if content:
@@ -1068,11 +1164,17 @@ class MainHandler(WheelView):
                 ## is possible.
                 upload = bool(addables)
 
-            for child in node.children():
-                content = child.content()
-
-                if not content:
-                    continue  ## ignore unattached nodes
+            ## ignore unattached nodes and those the user may not view
+            children = [(child, child.content()) for child in
+                        node.children().with_content()]
+            allowed = set(spoke.instance.pk for spoke in
+                          auth.has_access_many(self.request,
+                              [content.spoke() for (child, content)
+                               in children if content]))
+
+            for child, content in children:
+                if not content or content.pk not in allowed:
+                    continue
                 spoke = content.spoke()
 
                 selectable = is_selectable(child)
@@ -1094,14 +1196,10 @@ class MainHandler(WheelView):
                                                path=node.get_absolute_url(),
                                                mode=mode,
                                                selectable=(i==0)))
-            if node.isroot():
-                break
-            node = node.parent()
 
         ## generate the crumbs
         crumbs = []
-        node = start
-        while True:
+        for node in lineage:
             content = node.content()
             selectable = is_selectable(node)
             if node.isroot():
@@ -1111,7 +1209,6 @@ class MainHandler(WheelView):
             crumbs.insert(0, dict(path=node.get_absolute_url(),
                                   selectable=selectable,
                                   title=node.content().title))
-            node = node.parent()
 
         crumbtpl = self.render_template("wheelcms_axle/popup_crumbs.html",
                                         crumbs=crumbs)
@@ -1139,12 +1236,36 @@ class MainHandler(WheelView):
                                                   type=type))
 
 
+        ## a bulk drop sends several files in a single request, each
+        ## becomes content of its own
+        uploads = self.request.FILES.getlist('storage')
+        if len(uploads) <= 1:
+            return self.create_upload(formclass, parent, self.request.FILES)
+
+        results = []
+        for upload in uploads:
+            files = MultiValueDict({'storage': [upload]})
+            data = self.request.POST.copy()
+            ## title and slug default to those of the file
+            data.pop('title', None)
+            data.pop('slug', None)
+            results.append(self.create_upload(formclass, parent, files, data))
+
+        ok = [r['path'] for r in results if r['status'] == "ok"]
+        errors = dict((u.name, r['errors'])
+                      for (u, r) in zip(uploads, results)
+                      if r['status'] != "ok")
+        return dict(status="error" if errors else "ok", paths=ok,
+                    path=ok[0] if ok else None, errors=errors)
+
+    def create_upload(self, formclass, parent, files, data=None):
+        """ create content in parent from a single uploaded file """
         self.context['form'] = \
-        self.form = formclass(data=self.request.POST,
+        self.form = formclass(data=data or self.request.POST,
                               parent=parent,
                               attach=False,
                               reserved=self.reserved(),
-                              files=self.request.FILES,
+                              files=files,
                               )
 
         if self.form.is_valid():
@@ -0,0 +1,38 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from wheelcms_axle.node import backfill_paths
+from wheelcms_axle import translate
+
+
+class Command(BaseCommand):
+    """ Create missing node paths for (newly enabled) languages """
+    args = '[language ...]'
+    help = 'Create missing node paths for the given (or all) languages'
+
+    base_options = (
+        make_option("-q", "--quiet", action="store_false", dest="verbose",
+                    default=True, help="Be quiet"),
+        make_option("--chunksize", action="store", type="int",
+                    dest="chunksize", default=500,
+                    help="Number of nodes to process per transaction"),
+    )
+    option_list = BaseCommand.option_list + base_options
+
+    def handle(self, *languages, **options):
+        verbose = options.get('verbose', True)
+        chunksize = options.get('chunksize', 500)
+
+        enabled = [l[0] for l in translate.languages()]
+        for language in languages:
+            if language not in enabled:
+                raise CommandError("Language %s is not enabled" % language)
+
+        for language in languages or enabled:
+            created, conflicts = backfill_paths(language, chunksize=chunksize)
+            if verbose:
+                print "Created %d paths for language %s" % (created, language)
+            for node_id, path in conflicts:
+                print "Path %s for node %d is already in use in language %s" \
+                      % (path, node_id, language)
@@ -0,0 +1,34 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from wheelcms_axle.storage import blob_fields, collect_garbage
+
+
+class Command(BaseCommand):
+    """ Remove content addressed blobs that are no longer referenced """
+    help = 'Delete stored blobs no longer referred to by any content'
+
+    base_options = (
+        make_option("-q", "--quiet", action="store_false", dest="verbose",
+                    default=True, help="Be quiet"),
+        make_option("-n", "--dry-run", action="store_true", dest="dry_run",
+                    default=False, help="Only list what would be deleted"),
+    )
+    option_list = BaseCommand.option_list + base_options
+
+    def handle(self, **options):
+        verbose = options.get('verbose', True)
+        dry_run = options.get('dry_run', False)
+
+        ## fields may share a storage (location), collect each only once
+        storages = {}
+        for model, fieldname in blob_fields:
+            storage = model._meta.get_field(fieldname).storage
+            storages.setdefault(storage.location, storage)
+
+        for storage in storages.values():
+            for name in collect_garbage(storage, dry_run=dry_run):
+                if verbose:
+                    print "%s %s" % ("Unreferenced" if dry_run else "Deleted",
+                                     name)
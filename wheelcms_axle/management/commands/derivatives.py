@@ -0,0 +1,61 @@
+import multiprocessing
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import get_model
+
+from wheelcms_axle.content import ImageContent, load_content
+from wheelcms_axle import derivatives
+
+
+def generate(args):
+    """ generate the derivatives of a single image, in a worker process """
+    label, pk, force = args
+    model = get_model(*label.split('.'))
+    instance = model.objects.get(pk=pk)
+    try:
+        derivatives.generate(instance.storage, force=force)
+    except IOError, e:
+        return (label, pk, str(e))
+    finally:
+        connection.close()
+    return (label, pk, None)
+
+
+class Command(BaseCommand):
+    """ Generate the scaled down versions of all images """
+    help = 'Generate the derivatives (scaled down versions) of all images'
+
+    base_options = (
+        make_option("-q", "--quiet", action="store_false", dest="verbose",
+                    default=True, help="Be quiet"),
+        make_option("--processes", action="store", type="int",
+                    dest="processes", default=None,
+                    help="Number of worker processes (default: #cpus)"),
+        make_option("--force", action="store_true", dest="force",
+                    default=False,
+                    help="Regenerate existing derivatives"),
+    )
+    option_list = BaseCommand.option_list + base_options
+
+    def handle(self, **options):
+        verbose = options.get('verbose', True)
+
+        images = [i for i in load_content(ImageContent.instances) if i]
+        jobs = [("%s.%s" % (i._meta.app_label, i._meta.object_name), i.pk,
+                 options.get('force', False)) for i in images]
+
+        ## don't share the connection with the forked workers
+        connection.close()
+        pool = multiprocessing.Pool(options.get('processes'))
+        try:
+            for label, pk, error in pool.imap_unordered(generate, jobs):
+                if error:
+                    print "Failed to process %s %d: %s" % (label, pk, error)
+        finally:
+            pool.close()
+            pool.join()
+
+        if verbose:
+            print "Processed %d images" % len(jobs)
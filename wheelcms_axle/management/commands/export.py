@@ -28,6 +28,10 @@ class Command(BaseCommand):
     base_options = (
         make_option("-q", "--quiet", action="store_false", dest="verbose",
                     default=True, help="Be quiet"),
+        make_option("--link", action="store_true", dest="link",
+                    default=False,
+                    help="Hardlink files in stead of copying them, "
+                         "e.g. for content addressed storage"),
     )
 
     option_list = BaseCommand.option_list + base_options
@@ -37,6 +41,7 @@ class Command(BaseCommand):
             raise CommandError("You must specificy a writable directory where the export can be written to")
 
         verbose = options.get('verbose', True)
+        link = options.get('link', False)
 
         mediadir = os.path.join(writeto, "media")
         if not os.path.exists(mediadir):
@@ -56,6 +61,17 @@ class Command(BaseCommand):
             dest = os.path.join(mediadir, file)
             source = os.path.join(settings.MEDIA_ROOT, file)
 
+            if link:
+                if os.path.exists(dest):
+                    os.unlink(dest)
+                try:
+                    os.link(source, dest)
+                    if verbose:
+                        print "Link %s to %s" % (source, dest)
+                    continue
+                except OSError:
+                    ## e.g. a different filesystem, fall back to copying
+                    pass
             if verbose:
                 print "Copy %s to %s" % (source, dest)
             shutil.copy(source, dest)
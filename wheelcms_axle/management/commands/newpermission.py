@@ -48,9 +48,8 @@ class Command(BaseCommand):
                     if assignments.count() == 0:
                         if verbose:
                             print c.title, s, "has no assignment for", permission
-                        for role in classassignment:
-                            RolePermission.assign(c, role, permission).save()
+                        auth.assign_perms(c, {permission:classassignment})
 
                         if wfassignment and wfassignment.get(permission):
-                            s.update_perms(c, {permission:wfassignment[permission]})
+                            s.update_perms({permission:wfassignment[permission]})
 
@@ -97,7 +97,7 @@ class Role(models.Model):
 
 ## signals for login/logout logging
 
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, class_prepared
 from django.dispatch import receiver
 from userena.signals import signup_complete
 from django.contrib.auth.signals import user_logged_in, user_logged_out
@@ -124,22 +124,81 @@ def create_profiles(app, **kwargs):
         for u in User.objects.all():
             WheelProfile.objects.get_or_create(user=u)
 
-@receiver(post_save, dispatch_uid="wheelcms_axle.spoke.assign_perms")
 def assign_perms(sender, instance, created, **kwargs):
-    
-    if issubclass(sender, Content):
-        spoke = instance.spoke()
-        if spoke:
+    """ connected to post_save of content models only """
+    spoke = instance.spoke()
+    if spoke:
+        if created:
+            spoke.assign_initial_perms()
+        else:
             spoke.assign_perms()
-            if created:
-                wf = spoke.workflow()
-                state = instance.state
-                assignment = wf.permission_assignment.get(state)
-                if assignment:
-                    spoke.update_perms(assignment)
-
-    if hasattr(sender, 'permission_assignment') and created:
-        assign_perms(instance, instance.permission_assignment)
+
+def connect_assign_perms(sender, **kwargs):
+    """ connected to class_prepared; per model so saving anything else
+        doesn't pass through assign_perms """
+    if issubclass(sender, Content) and not sender._meta.abstract:
+        post_save.connect(assign_perms, sender=sender,
+                          dispatch_uid="wheelcms_axle.spoke.assign_perms.%s.%s"
+                                       % (sender._meta.app_label,
+                                          sender._meta.object_name))
+
+def content_models(base=Content):
+    yield base
+    for model in base.__subclasses__():
+        for submodel in content_models(model):
+            yield submodel
+
+class_prepared.connect(connect_assign_perms,
+                       dispatch_uid="wheelcms_axle.spoke.connect_assign_perms")
+## and the content models defined before this module
+for model in content_models():
+    connect_assign_perms(model)
+
+from django.db.models.signals import post_delete
+from drole.models import RolePermission
+from .node import Paths
+from .signals import state_changed, paths_changed, subtree_removed
+from .pagecache import page_cache
+
+page_cache_models = (Content, Node, Paths, Configuration, Role, RolePermission)
+
+@receiver(post_save, dispatch_uid="wheelcms_axle.pagecache.saved")
+def invalidate_pages(sender, **kwargs):
+    """ anything that shows up in pages or decides who can see them
+        invalidates the anonymous page cache """
+    if issubclass(sender, page_cache_models):
+        page_cache.invalidate()
+
+## connected per model; a catch-all post_delete receiver would disable
+## django's fast (bulk) deletes for every model. Role permissions are
+## removed in bulk along with content (subtree_removed) or replaced on
+## state changes (state_changed)
+for model in (Content, Node, Paths, Configuration, Role):
+    post_delete.connect(invalidate_pages, sender=model,
+                        dispatch_uid="wheelcms_axle.pagecache.deleted.%s" %
+                                     model.__name__)
+
+@receiver(state_changed, dispatch_uid="wheelcms_axle.pagecache.state_changed")
+@receiver(paths_changed, dispatch_uid="wheelcms_axle.pagecache.paths_changed")
+@receiver(subtree_removed, dispatch_uid="wheelcms_axle.pagecache.subtree_removed")
+def invalidate_all_pages(sender, **kwargs):
+    page_cache.invalidate()
+
+@receiver(subtree_removed, dispatch_uid="wheelcms_axle.search.subtree_removed")
+def unindex_removed(sender, content, **kwargs):
+    """ the subtree's content is deleted in bulk, without the post_delete
+        signals haystack depends on; remove it from the search index(es) """
+    from haystack import connections
+    from haystack.exceptions import NotHandled
+
+    for alias in connections.connections_info:
+        index = connections[alias].get_unified_index()
+        for model, pk in content:
+            try:
+                index.get_index(model).remove_object(model(pk=pk),
+                                                     using=alias)
+            except NotHandled:
+                pass
 
 @receiver(post_save, sender=User, dispatch_uid='userena.created.permissions')
 def user_created(sender, instance, created, raw, using, **kwargs):
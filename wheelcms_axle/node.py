@@ -1,12 +1,15 @@
 import re
 
 from django.utils import translation
-from django.db import models, IntegrityError
+from django.db import models, IntegrityError, connection, transaction
 from django.core.urlresolvers import reverse
 from django.conf import settings
 
-from wheelcms_axle.utils import get_active_language
+from wheelcms_axle.utils import get_active_language, atomic, chunked
 from wheelcms_axle import translate
+from wheelcms_axle.signals import paths_changed, subtree_removed
+from wheelcms_axle.pathcache import path_cache
+from wheelcms_axle.pagecache import page_cache
 
 class NodeException(Exception):
     """ Base class for all Node exceptions """
@@ -31,7 +34,9 @@ class NodeNotFound(NodeException):
 
 from django.db.models.query import QuerySet
 from django.utils import timezone
-from django.db.models import Q
+from django.db.models import Q, Max
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
 import random
 
 def random_path():
@@ -42,6 +47,289 @@ def get_language():
     return get_active_language()
 
 
+def replace_prefix(model, field, old, new, depth=0, **filters):
+    """
+        Replace the prefix 'old' by 'new' in 'field' for each row where
+        'field' equals 'old' or starts with 'old/', in a single UPDATE.
+        Optionally adjust the depth column by 'depth'.
+
+        Must be called inside a transaction.
+    """
+    qn = connection.ops.quote_name
+    column = qn(field)
+
+    if connection.vendor == "mysql":
+        value = "CONCAT(%s, SUBSTR({0}, %s))".format(column)
+    else:
+        value = "%s || SUBSTR({0}, %s)".format(column)
+
+    sets = ["{0} = {1}".format(column, value)]
+    params = [new, len(old) + 1]
+    if depth:
+        sets.append("{0} = {0} + %s".format(qn('depth')))
+        params.append(depth)
+
+    where = ["({0} = %s OR {0} {1})".format(column,
+             connection.operators['startswith'] % '%s')]
+    params.extend([old, connection.ops.prep_for_like_query(old + '/') + '%'])
+    for k, v in filters.iteritems():
+        where.append("{0} = %s".format(qn(k)))
+        params.append(v)
+
+    cursor = connection.cursor()
+    cursor.execute("UPDATE {0} SET {1} WHERE {2}".format(
+                   qn(model._meta.db_table), ", ".join(sets),
+                   " AND ".join(where)), params)
+    transaction.set_dirty()
+    return cursor.rowcount
+
+
+def update_tree_paths(tree_paths, chunksize=150):
+    """
+        Set the tree_path (and depth) of many nodes, given a mapping of
+        pk -> tree_path, using one UPDATE per chunk of nodes.
+
+        Must be called inside a transaction.
+    """
+    qn = connection.ops.quote_name
+    cursor = connection.cursor()
+
+    for chunk in chunked(tree_paths.items(), chunksize):
+        path_cases = []
+        depth_cases = []
+        params = []
+        for pk, tree_path in chunk:
+            path_cases.append("WHEN %s THEN %s")
+            params.extend([pk, tree_path])
+        for pk, tree_path in chunk:
+            depth_cases.append("WHEN %s THEN %s")
+            params.extend([pk, tree_path.count('/')])
+        params.extend(pk for pk, tree_path in chunk)
+
+        cursor.execute("UPDATE {0} SET {1} = CASE {2} {3} END, "
+                       "{4} = CASE {2} {5} END WHERE {2} IN ({6})".format(
+                       qn(Node._meta.db_table), qn('tree_path'), qn('id'),
+                       " ".join(path_cases), qn('depth'),
+                       " ".join(depth_cases),
+                       ", ".join(["%s"] * len(chunk))), params)
+    transaction.set_dirty()
+
+
+def update_positions(positions):
+    """
+        Set the position of many nodes, given a mapping of pk -> position,
+        in a single UPDATE. The values are inlined (they're integers) to
+        avoid database limits on the number of query parameters.
+
+        Must be called inside a transaction.
+    """
+    if not positions:
+        return
+    qn = connection.ops.quote_name
+    cases = " ".join("WHEN %d THEN %d" % (int(pk), int(position))
+                     for (pk, position) in positions.iteritems())
+    ids = ", ".join("%d" % int(pk) for pk in positions)
+
+    cursor = connection.cursor()
+    cursor.execute("UPDATE {0} SET {1} = CASE {2} {3} END "
+                   "WHERE {2} IN ({4})".format(
+                   qn(Node._meta.db_table), qn('position'), qn('id'),
+                   cases, ids))
+    transaction.set_dirty()
+
+
+def lineage(model):
+    """ model and its concrete parents, most derived first """
+    return [model] + sorted(model._meta.get_parent_list(),
+                            key=lambda m: len(m._meta.get_parent_list()),
+                            reverse=True)
+
+
+def delete_rows(model, ids, column=None, chunksize=1000):
+    """
+        Delete the rows of model whose column (default: the primary key)
+        is in ids, bypassing the ORM's cascade collection and signals.
+        Dependent rows must have been deleted already.
+
+        Must be called inside a transaction.
+    """
+    qn = connection.ops.quote_name
+    column = column or model._meta.pk.column
+    cursor = connection.cursor()
+
+    for chunk in chunked(ids, chunksize):
+        cursor.execute("DELETE FROM {0} WHERE {1} IN ({2})".format(
+                       qn(model._meta.db_table), qn(column),
+                       ", ".join("%d" % int(i) for i in chunk)))
+    transaction.set_dirty()
+
+
+def delete_dependents(model, ids, skip=(), chunksize=500):
+    """
+        Delete the rows that depend on the given instances of model (and
+        its parents), except for those of the models in skip and parent
+        links:
+        - automatically created many to many rows, in both directions
+        - generic relations (e.g. tags, role permissions)
+        - anything else with a foreign key, according to its on_delete:
+          cascaded through the ORM so its own cascades are honoured, set
+          to NULL or its default, left alone, or refused (PROTECT)
+
+        The ORM deletes in bulk as long as there are no signal handlers
+        or further dependencies involved.
+    """
+    from django.contrib.contenttypes.generic import GenericForeignKey
+    from django.contrib.contenttypes.models import ContentType
+    from django.db.models.deletion import Collector, ProtectedError, \
+         CASCADE, PROTECT, SET_NULL, SET_DEFAULT, DO_NOTHING
+
+    def delete(qs_model, **filters):
+        (field, values), = filters.items()
+        for chunk in chunked(values, chunksize):
+            qs_model._default_manager.filter(**{field: chunk}).delete()
+
+    def referring(rel, ids):
+        for chunk in chunked(ids, chunksize):
+            yield rel.model._base_manager.filter(
+                  **{rel.field.name + '__in': chunk})
+
+    ids = list(ids)
+    generic = [f for m in models.get_models() for f in m._meta.virtual_fields
+               if isinstance(f, GenericForeignKey)]
+
+    for m in lineage(model):
+        for f in m._meta.local_many_to_many:
+            through = getattr(f.rel, 'through', None)
+            if through is not None and through._meta.auto_created:
+                delete(through, **{f.m2m_field_name() + '__in': ids})
+        for rel in m._meta.get_all_related_many_to_many_objects():
+            through = rel.field.rel.through
+            if through._meta.auto_created:
+                delete(through,
+                       **{rel.field.m2m_reverse_field_name() + '__in': ids})
+        for rel in m._meta.get_all_related_objects(include_hidden=True):
+            if rel.field.rel.parent_link or rel.model._meta.auto_created or \
+               any(issubclass(rel.model, s) for s in skip):
+                continue
+            on_delete = rel.field.rel.on_delete
+            if on_delete == CASCADE:
+                delete(rel.model, **{rel.field.name + '__in': ids})
+            elif on_delete == DO_NOTHING:
+                continue
+            elif on_delete == PROTECT:
+                for qs in referring(rel, ids):
+                    protected = list(qs[:1])
+                    if protected:
+                        raise ProtectedError(
+                            "Cannot delete some instances of model '%s' "
+                            "because they are referenced through a "
+                            "protected foreign key: '%s.%s'" % (
+                            m.__name__, rel.model.__name__, rel.field.name),
+                            protected)
+            elif on_delete in (SET_NULL, SET_DEFAULT):
+                value = None if on_delete == SET_NULL \
+                        else rel.field.get_default()
+                for qs in referring(rel, ids):
+                    qs.update(**{rel.field.name: value})
+            else:
+                ## e.g. SET(value), which tells a collector what to do
+                for qs in referring(rel, ids):
+                    collector = Collector(using=qs.db)
+                    on_delete(collector, rel.field, list(qs), qs.db)
+                    for model, updates in collector.field_updates.items():
+                        for (field, value), objs in updates.items():
+                            model._base_manager.filter(
+                                pk__in=[o.pk for o in objs]
+                            ).update(**{field.name: value})
+
+        ct = ContentType.objects.get_for_model(m)
+        for f in generic:
+            for chunk in chunked(ids, chunksize):
+                f.model._default_manager.filter(**{f.ct_field: ct,
+                                                   f.fk_field + '__in': chunk}
+                                                ).delete()
+
+
+def prefetch(nodes):
+    """
+        Fetch the paths and content of nodes in bulk so get_path(),
+        content() and primary_content() don't query them separately
+        for each node. Returns the nodes as a list.
+    """
+    from .content import Content, resolve_content
+
+    nodes = list(nodes)
+    bypk = dict((n.pk, n) for n in nodes)
+    for n in nodes:
+        n._paths = {}
+        n._urls = {}
+        n._contents = {}
+        n._primary_content = None
+
+    bases = []
+    ## stay below sqlite's default limit of 999 query parameters
+    for chunk in chunked(bypk.keys(), 900):
+        for node_id, language, path in Paths.objects.filter(
+                node__in=chunk).values_list('node_id', 'language', 'path'):
+            bypk[node_id]._paths[language] = path
+        bases.extend(Content.objects.filter(node__in=chunk))
+
+    bases.sort(key=lambda b: b.pk)
+    resolved = resolve_content(bases)
+    for base in bases:
+        node = bypk[base.node_id]
+        content = resolved.get(base.pk)
+        if content is not None:
+            content.node = node
+        node._contents.setdefault(base.language, content)
+        if node._primary_content is None:
+            node._primary_content = content
+    return nodes
+
+
+def backfill_paths(language, chunksize=500):
+    """
+        Create the missing paths in 'language' for all nodes, e.g. after
+        the language has been enabled, by copying the path of the
+        fallback language (or any other language). Nodes are processed
+        in chunks, each in its own transaction.
+
+        Returns the number of paths created and a list of (node id,
+        path) that could not be created because the path is already in
+        use in that language.
+    """
+    fallback = getattr(settings, 'FALLBACK', None)
+    missing = list(Node.objects.exclude(paths__language=language
+                   ).order_by('pk').values_list('pk', flat=True))
+    created = 0
+    conflicts = []
+
+    for chunk in chunked(missing, chunksize):
+        existing = {}
+        for node_id, lang, path in Paths.objects.filter(node__in=chunk
+                ).values_list('node_id', 'language', 'path'):
+            if node_id not in existing or lang == fallback:
+                existing[node_id] = path
+
+        taken = set(Paths.objects.filter(language=language,
+                    path__in=existing.values()
+                    ).values_list('path', flat=True))
+        paths = []
+        for node_id, path in sorted(existing.items()):
+            if path in taken:
+                conflicts.append((node_id, path))
+                continue
+            taken.add(path)
+            paths.append(Paths(node_id=node_id, language=language,
+                               path=path))
+        with atomic():
+            Paths.objects.bulk_create(paths)
+        created += len(paths)
+    return created, conflicts
+
+
+_language_proxies = {}
+
 def node_proxy_factory(base, l):
     """
         Create a proxy model based on the base (usually Node or some derivative)
@@ -49,7 +337,21 @@ def node_proxy_factory(base, l):
         We need to use type() here in stead of defining a class locally because it
         will need to be uniquely named (per language). A generick "LanguageProxy"
         would be cached by django and simply not work.
+
+        Proxies are created once per (base, language) and reused afterwards;
+        creating a model class is expensive and django keeps a reference
+        to each of them.
     """
+    ## don't stack proxies, always proxy the actual base
+    base = getattr(base, '_proxied_base', base)
+
+    if not l:
+        return base
+
+    try:
+        return _language_proxies[(base, l)]
+    except KeyError:
+        pass
 
     class Meta:
         proxy = True
@@ -68,32 +370,72 @@ def node_proxy_factory(base, l):
                  __module__=base.__module__,
                  __eq__=__eq__,
                  __unicode__=__unicode__,
+                 _proxied_base=base,
                    preferred_language=l)
 
-    lang = l.upper() if l else ""
-    LanguageProxy = type(str("Node" + lang),
+    LanguageProxy = type(str(base.__name__ + l.upper()),
                          (base,),
                          attrs)
 
+    _language_proxies[(base, l)] = LanguageProxy
     return LanguageProxy
 
 
 class NodeQuerySet(QuerySet):
+    _with_content = False
+    _url_language = None
+
+    def _clone(self, *args, **kwargs):
+        c = super(NodeQuerySet, self)._clone(*args, **kwargs)
+        if '_with_content' not in kwargs:
+            c._with_content = self._with_content
+            c._url_language = self._url_language
+        return c
+
+    def with_content(self, language=None):
+        """
+            Prefetch the paths and content in all languages of the nodes
+            when the queryset is evaluated, and their absolute url in the
+            given language (or their preferred language)
+        """
+        return self._clone(_with_content=True, _url_language=language)
+
+    def iterator(self):
+        nodes = super(NodeQuerySet, self).iterator()
+        if not self._with_content:
+            return nodes
+        nodes = prefetch(nodes)
+        for n in nodes:
+            n.get_absolute_url(self._url_language)
+        return iter(nodes)
+
     def children(self, node):
         """ only return direct children """
-        return self.filter(
-                  tree_path__regex="^%s/[%s]+$" % (node.tree_path, Node.ALLOWED_CHARS),
-                  )
+        return self.offspring(node).filter(depth=node.depth + 1)
 
     def offspring(self, node):
         """ children, grandchildren, etc """
-        return self.filter(
-                  tree_path__regex="^%s/[%s]+" % (node.tree_path, Node.ALLOWED_CHARS),
-                  )
+        ## a prefix match can be served from the tree_path index, a regex
+        ## can't
+        return self.filter(tree_path__startswith=node.tree_path + '/')
 
     def attached(self):
         return self.filter(contentbase__isnull=False)
 
+    def accessible_by(self, request, permission=None, language=None):
+        """
+            Only the nodes with content (in language, if given)
+            request.user has permission (by default view_content) on,
+            filtered by the database
+        """
+        from .auth import accessible_q
+        q = dict(contentbase__isnull=False)
+        if language:
+            q['contentbase__language'] = language
+        ## a single filter() so all conditions apply to the same content
+        return self.filter(accessible_q(request, permission, "contentbase__"),
+                           **q).distinct()
+
     def public(self):
         now = timezone.now()
         return (self.attached().filter(
@@ -121,6 +463,12 @@ class NodeManager(models.Manager):
     def offspring(self, node):
         return self.all().offspring(node)
 
+    def with_content(self, language=None):
+        return self.all().with_content(language)
+
+    def accessible_by(self, request, permission=None, language=None):
+        return self.all().accessible_by(request, permission, language)
+
     def visible(self, user):
         """
             XXX TODO: when is content visible? May be even more
@@ -131,11 +479,13 @@ class NodeBase(models.Model):
     ROOT_PATH = ""
     ALLOWED_CHARS = "abcdefghijklmnopqrstuvwxyz0123456789_-"
     MAX_PATHLEN = 100
-    POSITION_INTERVAL = 100
+    POSITION_INTERVAL = 1024
 
     validpathre = re.compile("^[%s]{1,%d}$" % (ALLOWED_CHARS, MAX_PATHLEN))
 
     tree_path = models.CharField(max_length=255, blank=False, unique=True, default=random_path)
+    ## the number of components in tree_path, kept in sync by save()
+    depth = models.IntegerField(default=0, db_index=True)
     position = models.IntegerField(default=0)
 
     objects = NodeManager()
@@ -149,6 +499,11 @@ class NodeBase(models.Model):
         self._slug = kw.get('slug', None)
         self._parent = kw.get('parent', None)
         self._langslugs = kw.get('langslugs', {})
+        ## filled by prefetch()
+        self._paths = None
+        self._contents = None
+        self._primary_content = None
+        self._urls = None
         self.preferred_language = self.preferred_language or None
 
         try:
@@ -175,6 +530,12 @@ class NodeBase(models.Model):
         else:
             langs = [language]
 
+        if self._contents is not None:
+            for l in langs:
+                if l in self._contents:
+                    return self._contents[l]
+            return None
+
         for l in langs:
             try:
                 return self.contentbase.get(language=l).content()
@@ -185,6 +546,8 @@ class NodeBase(models.Model):
     def primary_content(self):
         """ what determines which language is primary? First one
             created? A specific language? """
+        if self._contents is not None:
+            return self._primary_content
         try:
             return self.contentbase.all()[0].content()
         except IndexError:
@@ -199,15 +562,19 @@ class NodeBase(models.Model):
     def get(cls, path, language=None):
         """ retrieve node directly by path. Returns None if not found """
         detect_or_prefer_language = language or get_language()
+        ## a single query, the node comes along with its path
         try:
-            n = Paths.objects.get(path=path, language=detect_or_prefer_language).node
-            n.preferred_language = language
-            return n
+            n = Paths.objects.select_related('node').get(path=path,
+                               language=detect_or_prefer_language).node
         except Paths.DoesNotExist:
             ## the root may not yet have been created
             if path == "":
                 return cls.root(language=detect_or_prefer_language)
             return None
+        path_cache.set(n.id, detect_or_prefer_language, path)
+
+        n.preferred_language = language
+        return n
 
 
     def set(self, content, replace=False, language=None):
@@ -235,6 +602,7 @@ class NodeBase(models.Model):
         except Content.DoesNotExist:
             pass
 
+        self._contents = None
         self.contentbase.add(content) #.content_ptr  # XXX is _ptr documented?
         #content.node = self
         ## avoid updating last_modified
@@ -261,102 +629,137 @@ class NodeBase(models.Model):
         return node.tree_path.startswith(self.tree_path + '/')
 
     def find_position(self, position=-1, after=None, before=None):
-        children = self.children()
-        positions = (c.position for c in self.children())
-
+        """
+            Find a position for a (new) child, either at the end, directly
+            after or directly before a sibling. Positions are spaced
+            POSITION_INTERVAL apart so a new position can usually be
+            found between two siblings. If there's no room left, all
+            children are respaced in a single update.
+        """
         if after:
-            try:
-                afterafter_all = self.childrenq(position__gt=after.position,
-                                            order="position")[:1]
-                afterafter = afterafter_all.get()
-                position = (after.position + afterafter.position) / 2
-                if position == after.position:
-                    ## there's a conflict. the new position will be 
-                    ## "after.position + POSITION_INTERVAL", renumber
-                    ## everything else
-                    position = after.position + self.POSITION_INTERVAL
-                    for i, n in enumerate(afterafter_all):
-                        n.position = position + ((i + 1) * self.POSITION_INTERVAL)
-                        n.save()
-                    # XXX self.debug("repositioning children")
-            except Node.DoesNotExist:
+            afterafter = self.childrenq(position__gt=after.position,
+                                        order="position"
+                                        ).values_list('position', flat=True)[:1]
+            if not afterafter:
                 ## after is the last childnode
-                position = after.position + self.POSITION_INTERVAL
+                return after.position + self.POSITION_INTERVAL
+            position = (after.position + afterafter[0]) // 2
+            if position == after.position:
+                ## there's a conflict, respace all children and insert
+                ## halfway after.
+                after.position = self.reorder()[after.pk]
+                position = after.position + self.POSITION_INTERVAL // 2
         elif before:
-            try:
-                beforebefore_all = self.childrenq(position__lt=before.position,
-                                            order="position")
-                beforebefore = beforebefore_all.latest("position")
-                position = (before.position + beforebefore.position) / 2
-                if position == beforebefore.position:
-                    ## there's a conflict. the new position will be 
-                    ## "before.position", renumber before and everything
-                    ## else after it.
-                    position = before.position
-                    everything_after = self.childrenq(
-                                           position__gte=before.position,
-                                           order="position")
-                    for i, n in enumerate(everything_after):
-                        n.position = position + ((i + 1) *
-                                                 self.POSITION_INTERVAL)
-                        n.save()
-                    # XXX self.debug("repositioning children")
-            except Node.DoesNotExist:
+            beforebefore = self.childrenq(position__lt=before.position,
+                                          order="-position"
+                                          ).values_list('position', flat=True)[:1]
+            if not beforebefore:
                 ## before is the first childnode
-                position = before.position - self.POSITION_INTERVAL
+                return before.position - self.POSITION_INTERVAL
+            position = (before.position + beforebefore[0]) // 2
+            if position == beforebefore[0]:
+                ## there's a conflict, respace all children and insert
+                ## halfway before.
+                before.position = self.reorder()[before.pk]
+                position = before.position - self.POSITION_INTERVAL // 2
         elif position == -1:
-            if children.count():
-                position = max(positions) + self.POSITION_INTERVAL
-            else:
+            last = self.childrenq().aggregate(last=Max('position'))['last']
+            if last is None:
                 position = 0
+            else:
+                position = last + self.POSITION_INTERVAL
         return position
 
+    def reorder(self, order=()):
+        """
+            Apply a new order to the children of this node in a single
+            update. order is a sequence of children (or their ids);
+            children not mentioned keep their relative order after those
+            that are. Returns a mapping of child id to its new position.
+        """
+        ids = [getattr(o, 'pk', o) for o in order]
+        current = list(self.childrenq().values_list('pk', flat=True))
+        children = set(current)
+        ids = [i for i in ids if i in children]
+        mentioned = set(ids)
+        ids += [i for i in current if i not in mentioned]
+
+        positions = dict((pk, i * self.POSITION_INTERVAL)
+                         for (i, pk) in enumerate(ids))
+        with atomic():
+            update_positions(positions)
+        ## bypasses post_save, yet changes navigation
+        page_cache.invalidate()
+
+        for o in order:
+            if isinstance(o, NodeBase) and o.pk in positions:
+                o.position = positions[o.pk]
+        return positions
+
     def get_path(self, language=None):
         language = language or self.preferred_language or get_language()
+        if self._paths and language in self._paths:
+            return self._paths[language]
+        path = path_cache.get_path(self.pk, language)
+        if path is not None:
+            return path
         try:
-            return Paths.objects.get(node=self, language=language).path
+            path = Paths.objects.get(node=self, language=language).path
+            path_cache.set(self.pk, language, path)
+            return path
         except Paths.DoesNotExist:
             ## The path may not exist because at the time of the creation of
-            ## the node that language may not have been enabled yet.
-            ## Create the path using any of the existis paths for this node.
-            ## This is a bit arbitrary; using FALLBACK_LANGUAGE might make
-            ## more sense but that might not exist either. XXX
-            fallback = Paths.objects.filter(node=self)
-            if fallback.exists():
-                p = Paths(node=self, language=language, path=fallback[0].path)
-                p.save()
-                return p.path
-            raise
+            ## the node that language may not have been enabled yet. Use
+            ## any of the existing paths for this node, preferably the
+            ## fallback language's; the backfillpaths command creates the
+            ## missing paths.
+            fallback = dict(Paths.objects.filter(node=self
+                            ).values_list('language', 'path'))
+            if not fallback:
+                raise
+            return fallback.get(getattr(settings, 'FALLBACK', None)) or \
+                   fallback.values()[0]
 
     def save(self, *args, **kw):
         ## If the object has not yet been saved (ever), create the node's paths
-        saved = True
-        if self.pk is None:
-            saved = False
-
-
-        ## first save the object so we can create references
-        super(NodeBase, self).save(*args, **kw)
+        if self.pk is not None:
+            self.depth = self.tree_path.count('/')
+            return super(NodeBase, self).save(*args, **kw)
+
+        with atomic():
+            self.depth = self.tree_path.count('/')
+
+            ## first save the object so we can create references
+            super(NodeBase, self).save(*args, **kw)
+
+            ## create paths based on self._slug / self._parent which were
+            ## passed to __init__, in a single statement
+            if self._parent:
+                path = self._parent.tree_path + '/' + str(self.id)
+                parent_paths = dict(Paths.objects.filter(node=self._parent
+                                    ).values_list('language', 'path'))
+            else:
+                path = '' # '/' + str(self.id) -- be consistent with 'old' behavior, for now
 
-        ## create paths based on self._slug / self._parent which were passed to __init__
-        if not saved:
+            paths = []
             for language, langname in translate.languages():
-                try:
-                    langpath = Paths.objects.get(node=self, language=language)
-                except Paths.DoesNotExist:
-                    langpath = Paths(node=self, language=language)
-
-                langslug = translate.language_slug(self._langslugs, self._slug, language)
-
+                langslug = translate.language_slug(self._langslugs,
+                                                   self._slug, language)
                 if not self._parent:
-                    path = '' # '/' + str(self.id) -- be consistent with 'old' behavior, for now
-                    langpath.path = langslug
+                    langpath = langslug
                 else:
-                    path = self._parent.tree_path + '/' + str(self.id)
-                    langpath.path = self._parent.get_path(language) + '/' + langslug
-                langpath.save()
+                    parentpath = parent_paths.get(language)
+                    if parentpath is None:
+                        parentpath = self._parent.get_path(language)
+                    langpath = parentpath + '/' + langslug
+                paths.append(Paths(node=self, language=language,
+                                   path=langpath))
+            Paths.objects.bulk_create(paths)
+            path_cache.invalidate((self.id, p.language, p.path)
+                                  for p in paths)
 
             self.tree_path = path
+            self.depth = path.count('/')
             super(NodeBase, self).save()
 
     def add(self, path=None, langslugs={}, position=-1, after=None, before=None):
@@ -398,10 +801,13 @@ class NodeBase(models.Model):
         child.position = position
         child.save()
 
-    def paste(self, node, copy=False):
+    def paste(self, node, copy=False, progress=None):
         """
             Move a node elsewhere in the tree, optionally copying the node
             (copy-paste) or deleting the original (cut-paste)
+
+            When copying, progress(done, total) is invoked, if specified,
+            for each node that was processed.
         """
         ## a move is just rewriting/renaming the child and its offspring,
         ## a copy is recreating the node
@@ -411,110 +817,228 @@ class NodeBase(models.Model):
 
         ## how to deal with the position? Insert at the bottom?
 
-        from .content import ContentCopyException
+        if copy:
+            return self._copy(node, progress=progress)
 
         failed = []
         success = []
 
-        if copy:
-            slug_per_lang = {}
-            for p in node.paths.all():
-                lang, path = p.language, p.path
+        if node == self or node.is_ancestor(self):
+            raise CantMoveToOffspring()
+        oldpath = node.tree_path
+        oldbase, slug = oldpath.rsplit("/", 1)
+        if oldbase == self.tree_path:
+            ## pasting into its own parent, nothing to do
+            return node, success, failed
 
-                if path == "":
-                    slug = "root"
-                else:
-                    base_slug = slug = path.rsplit('/', 1)[1]
-
-                count = 0
-                while self.child(slug, lang):
-                    slug = "copy_%s_of_%s" % (count, base_slug)
-                    count += 1
-                slug_per_lang[lang] = slug
-
-
-            base = self.add(langslugs=slug_per_lang)
-            if node.content():
-                try:
-                    node.content().copy(node=base)
-                    success.append(node.tree_path)
-                except ContentCopyException:
-                    failed.append((node.tree_path, "Content cannot be copied"))
-                    base.delete()
-                    ## no need to continue
-                    return base, success, failed
-
-            for o in Node.objects.offspring(node).order_by("tree_path"):
-                ## skip all offspring of a failed node
-                for f, reason in failed:
-                    if o.tree_path.startswith(f + '/'):
-                        break
-                else:
-                    langslugs = dict((p.language, p.path.rsplit("/", 1)[1]) for  p in o.paths.all())
-                    n = Node(langslugs=langslugs, parent=base)
-                    n.save()
-                    if o.content():
-                        try:
-                            o.content().copy(node=n)
-                            success.append(o.tree_path)
-                        except ContentCopyException:
-                            n.delete()
-                            failed.append((o.tree_path, "Content cannot be copied"))
-            return base, success, failed
-
-        else:
-            if node == self or node.is_ancestor(self):
-                raise CantMoveToOffspring()
-            oldpath = node.tree_path
-            oldbase, slug = oldpath.rsplit("/", 1)
-            if oldbase == self.tree_path:
-                ## pasting into its own parent, nothing to do
-                return node, success, failed
-
-            ## XXX somehow batch/transaction this
-            for o in node_proxy_factory(Node, self.preferred_language).objects.offspring(node):
-                o.tree_path = self.tree_path + o.tree_path[len(oldbase):]
-                o.save()
-                success.append(o.tree_path)
-            node.tree_path = self.tree_path + '/' + str(node.id)
+        with atomic():
             ## move to end
             node.position = self.find_position(position=-1)
+
+            newpath = self.tree_path + '/' + str(node.id)
+            replace_prefix(Node, 'tree_path', oldpath, newpath,
+                           depth=self.depth + 1 - node.depth)
+            node.tree_path = newpath
             node.save()
+
+            success.extend(Node.objects.offspring(node).values_list(
+                           'tree_path', flat=True))
             success.append(node.tree_path)
 
             ## the great renaming
-            # import pytest; pytest.set_trace()
+            localized_paths = dict(Paths.objects.filter(node=node
+                                   ).values_list('language', 'path'))
+            my_paths = dict(Paths.objects.filter(node=self
+                            ).values_list('language', 'path'))
+            changed = []
+
             for language, langname in translate.languages():
-                try:
-                    localized_path = Paths.objects.get(node=node, language=language)
-                except Paths.DoesNotExist:
+                localized_path = localized_paths.get(language)
+                if localized_path is None:
                     continue
 
-                slug = localized_path.path.rsplit('/', 1)[1]
+                slug = localized_path.rsplit('/', 1)[1]
 
-                mypath = self.get_path(language)
-                newpath = mypath + '/' + slug
-                count = 0
+                mypath = my_paths.get(language)
+                if mypath is None:
+                    mypath = self.get_path(language)
+                newpath = self._free_path(mypath + '/' + slug, language)
 
-                while Paths.objects.filter(path=newpath, language=language).exists():
-                    newpath = mypath + '/' +  slug + "_" + str(count)
-                    count += 1
+                replace_prefix(Paths, 'path', localized_path, newpath,
+                               language=language)
+                changed.append((language, localized_path, newpath))
 
-                #if testmode:
-                #if Paths.objects.filter(path=newpath, language=language).exists():
-                #    raise DuplicatePathException(newpath, language)
-                #else:
-                for p in Paths.objects.filter(Q(path=localized_path.path) |
-                                              Q(path__startswith=localized_path.path + '/'),
-                                              language=language):
-                    remainder = p.path[len(localized_path.path):]
+        for language, oldpath, newpath in changed:
+            paths_changed.send_robust(sender=node.__class__, node=node,
+                                      language=language,
+                                      oldpath=oldpath, newpath=newpath)
 
-                    p.path = newpath + remainder
+        return node, success, failed
 
-                    p.save()
+    def _free_path(self, path, language, batch=20):
+        """
+            Return path, or the first of path_0, path_1, ... that's not
+            taken in language. Candidates are looked up (by the unique
+            index) in batches, not their offspring
+        """
+        candidates = [path]
+        count = 0
+        while True:
+            candidates.extend("%s_%d" % (path, i)
+                              for i in range(count, count + batch))
+            taken = set(Paths.objects.filter(language=language,
+                        path__in=candidates).values_list('path', flat=True))
+            for candidate in candidates:
+                if candidate not in taken:
+                    return candidate
+            count += batch
+            candidates = []
+
+    def _copy(self, node, progress=None):
+        """
+            Copy node and its offspring below self. The source subtree is
+            read in a single ordered pass after which the nodes and their
+            paths are created in bulk. Content is copied per node, its
+            many to many relations in bulk.
 
+            If content can't be copied, its node and offspring are skipped
+        """
+        from .content import Content, ContentCopyException, copy_m2m
+        from .content import resolve_content
 
-        return node, success, failed
+        failed = []
+        success = []
+
+        language = node.preferred_language or get_language()
+        fallback = translate.fallback_languages(language)
+
+        offspring = list(Node.objects.offspring(node).order_by("tree_path"))
+        total = len(offspring) + 1
+
+        ## source slugs per node, per language
+        langslugs = {}
+        for pk, lang, path in Paths.objects.filter(
+                              Q(node=node) |
+                              Q(node__tree_path__startswith=node.tree_path + '/')
+                              ).values_list('node', 'language', 'path'):
+            langslugs.setdefault(pk, {})[lang] = \
+                path.rsplit('/', 1)[1] if path else "root"
+
+        ## source content, in order of language preference
+        contents = {}
+        for c in Content.objects.filter(
+                 Q(node=node) |
+                 Q(node__tree_path__startswith=node.tree_path + '/'),
+                 language__in=fallback):
+            current = contents.get(c.node_id)
+            if current is None or \
+               fallback.index(c.language) < fallback.index(current.language):
+                contents[c.node_id] = c
+        resolve_content(contents.values())
+
+        ## find a free slug for the copy, per language
+        slug_per_lang = {}
+        for lang, base_slug in langslugs.get(node.pk, {}).iteritems():
+            mypath = self.get_path(lang)
+            taken = set(Paths.objects.filter(
+                        Q(path=mypath + '/' + base_slug) |
+                        Q(path__startswith=mypath + '/copy_',
+                          path__endswith='_of_' + base_slug),
+                        language=lang).values_list('path', flat=True))
+            slug = base_slug
+            count = 0
+            while mypath + '/' + slug in taken:
+                slug = "copy_%s_of_%s" % (count, base_slug)
+                count += 1
+            slug_per_lang[lang] = slug
+
+        base = self.add(langslugs=slug_per_lang)
+        content = contents.get(node.pk)
+        if content:
+            try:
+                content.content().copy(node=base)
+                success.append(node.tree_path)
+            except ContentCopyException:
+                failed.append((node.tree_path, "Content cannot be copied"))
+                base.delete()
+                ## no need to continue
+                return base, success, failed
+        if progress:
+            progress(1, total)
+
+        if not offspring:
+            return base, success, failed
+
+        ## create the offspring nodes in bulk. They get a temporary
+        ## tree_path from which their id can be resolved afterwards
+        token = random_path()
+        with atomic():
+            for chunk in chunked(enumerate(offspring), 500):
+                Node.objects.bulk_create(
+                    [Node(tree_path="%s-%d" % (token, i), position=o.position)
+                     for (i, o) in chunk])
+            created = dict((n.tree_path, n) for n in Node.objects.filter(
+                           tree_path__startswith=token + '-'))
+
+            new_nodes = {node.tree_path: base}
+            tree_paths = {}
+            for i, o in enumerate(offspring):
+                n = created["%s-%d" % (token, i)]
+                parent = new_nodes[o.tree_path.rsplit('/', 1)[0]]
+                n.tree_path = tree_paths[n.pk] = \
+                    parent.tree_path + '/' + str(n.pk)
+                n.depth = parent.depth + 1
+                new_nodes[o.tree_path] = n
+            update_tree_paths(tree_paths)
+
+            ## create the paths for all languages, the same way save() does
+            new_paths = {node.tree_path: dict(base.paths.values_list(
+                                              'language', 'path'))}
+            paths = []
+            for o in offspring:
+                parent_paths = new_paths[o.tree_path.rsplit('/', 1)[0]]
+                slugs = langslugs.get(o.pk, {})
+                mypaths = new_paths[o.tree_path] = {}
+                for lang, langname in translate.languages():
+                    mypaths[lang] = parent_paths[lang] + '/' + \
+                                    translate.language_slug(slugs, None, lang)
+                    paths.append(Paths(node=new_nodes[o.tree_path],
+                                       language=lang, path=mypaths[lang]))
+            for chunk in chunked(paths, 300):
+                Paths.objects.bulk_create(chunk)
+
+        ## copy the content
+        copies = []
+        skipped = []
+        for i, o in enumerate(offspring):
+            ## skip all offspring of a failed node
+            for f, reason in failed:
+                if o.tree_path.startswith(f + '/'):
+                    break
+            else:
+                content = contents.get(o.pk)
+                if content:
+                    content = content.content()
+                    try:
+                        copies.append((content, content.copy(
+                                       node=new_nodes[o.tree_path],
+                                       m2m=False)))
+                        success.append(o.tree_path)
+                    except ContentCopyException:
+                        skipped.append(new_nodes[o.tree_path].tree_path)
+                        failed.append((o.tree_path,
+                                       "Content cannot be copied"))
+            if progress:
+                progress(i + 2, total)
+
+        copy_m2m(copies)
+
+        for tree_path in skipped:
+            Node.objects.filter(Q(tree_path=tree_path) |
+                                Q(tree_path__startswith=tree_path + '/')
+                                ).delete()
+
+        return base, success, failed
 
     def remove(self, childslug, language=None):
         """ remove a child, recursively """
@@ -522,8 +1046,71 @@ class NodeBase(models.Model):
 
         if child is None:
             raise NodeNotFound(self.tree_path + '/' + childslug)
-        node_proxy_factory(Node, self.preferred_language).objects.offspring(child).delete()
-        child.delete()
+        child.delete_subtree()
+
+    def delete_subtree(self):
+        """
+            Delete this node and its offspring, their paths and content in
+            bulk, table by table, in stead of through the ORM's per object
+            cascade. No per object signals are sent; a single
+            subtree_removed signal is sent afterwards.
+
+            Returns the number of nodes deleted.
+        """
+        from .content import Content, content_class
+
+        nodes = Q(pk=self.pk) | Q(tree_path__startswith=self.tree_path + '/')
+        related = Q(node=self) | \
+                  Q(node__tree_path__startswith=self.tree_path + '/')
+
+        with atomic():
+            node_ids = list(Node.objects.filter(nodes
+                            ).values_list('pk', flat=True))
+            paths = list(Paths.objects.filter(related).values_list(
+                         'node_id', 'language', 'path'))
+            bytype = {}
+            for pk, meta_type in Content.objects.filter(related
+                                 ).values_list('pk', 'meta_type'):
+                bytype.setdefault(meta_type, []).append(pk)
+
+            content = []
+            for meta_type, pks in bytype.iteritems():
+                klass = content_class(meta_type) if meta_type else Content
+                delete_dependents(klass, pks)
+                ## most derived table first
+                for model in lineage(klass):
+                    delete_rows(model, pks)
+                content.extend((klass, pk) for pk in pks)
+
+            delete_dependents(Node, node_ids, skip=(Paths, Content))
+            delete_rows(Paths, node_ids, column='node_id')
+            delete_rows(Node, node_ids)
+
+        subtree_removed.send_robust(sender=self.__class__, node=self,
+                                    nodes=node_ids, paths=paths,
+                                    content=content)
+        return len(node_ids)
+
+    def ancestors(self, include_self=False, language=None):
+        """
+            Return the ancestors of this node, root first, optionally
+            including the node itself. The ancestors are derived from
+            tree_path and fetched in a single query, their paths and
+            content are prefetched.
+        """
+        parts = self.tree_path.split('/')
+        tree_paths = ['/'.join(parts[:i]) for i in range(1, len(parts))]
+        language = language or self.preferred_language
+
+        bypath = dict((n.tree_path, n) for n in
+                      node_proxy_factory(self.__class__, language
+                      ).objects.filter(tree_path__in=tree_paths))
+        nodes = [bypath[p] for p in tree_paths if p in bypath]
+        if include_self:
+            nodes.append(self)
+        for n in nodes:
+            n.preferred_language = language
+        return prefetch(nodes)
 
     def parent(self):
         """ return the parent for this node """
@@ -559,32 +1146,53 @@ class NodeBase(models.Model):
         ## if no language was specified, rename all
         languages = [language] if language else [l[0] for l in translate.languages()]
 
-        for testmode in (True, False):
-            ## first loop checks if all relevant languages can be renamed, second loop renames
-            for language in languages:
-                try:
-                    localized_path = Paths.objects.get(node=self, language=language)
-                except Paths.DoesNotExist:
-                    continue
-
-                newpath = localized_path.path.rsplit("/", 1)[0] + "/" + slug
-
-                if testmode:
-                    if Paths.objects.filter(path=newpath, language=language).exists():
-                        raise DuplicatePathException(newpath, language)
-                else:
-                    for p in Paths.objects.filter(Q(path=localized_path.path) |
-                                                  Q(path__startswith=localized_path.path + '/'),
-                                                  language=language):
-                        remainder = p.path[len(localized_path.path):]
-                        p.path = newpath + remainder
-                        p.save()
-
+        localized_paths = dict(Paths.objects.filter(node=self,
+                               language__in=languages
+                               ).values_list('language', 'path'))
+        newpaths = dict((language, path.rsplit("/", 1)[0] + "/" + slug)
+                        for (language, path) in localized_paths.items())
+
+        ## check if all relevant languages can be renamed before renaming
+        q = Q(pk__in=[])
+        for language, newpath in newpaths.items():
+            q |= Q(path=newpath, language=language)
+        duplicates = Paths.objects.filter(q).values_list('path', 'language')[:1]
+        if duplicates:
+            raise DuplicatePathException(*duplicates[0])
+
+        with atomic():
+            for language, newpath in newpaths.items():
+                replace_prefix(Paths, 'path', localized_paths[language],
+                               newpath, language=language)
+
+        for language, newpath in newpaths.items():
+            paths_changed.send_robust(sender=self.__class__, node=self,
+                                      language=language,
+                                      oldpath=localized_paths[language],
+                                      newpath=newpath)
+
+
+    def prefetched(self):
+        """ prefetch the paths and content of this node, unless already
+            done """
+        if self._contents is None:
+            prefetch([self])
+        return self
 
     def get_absolute_url(self, language=None):
-        ## strip any leading / since django will add that as well
         language = language or self.preferred_language
+        if self._urls is None:
+            return self._get_absolute_url(language)
+        ## without a language the path of the active language is used
+        key = language or get_language()
+        try:
+            return self._urls[key]
+        except KeyError:
+            url = self._urls[key] = self._get_absolute_url(language)
+            return url
 
+    def _get_absolute_url(self, language):
+        ## strip any leading / since django will add that as well
         active_language = translation.get_language()
         try:
             if language:
@@ -612,3 +1220,26 @@ class Paths(models.Model):
 
     def __unicode__(self):
         return u"path [%s] for language %s on node %s" % (self.path, self.language, self.node)
+
+
+@receiver(paths_changed, dispatch_uid="wheelcms_axle.node.invalidate_moved_paths")
+def invalidate_moved_paths(sender, node, language, oldpath, newpath, **kwargs):
+    """ invalidate the cached paths of a renamed or moved subtree """
+    moved = Paths.objects.filter(Q(path=newpath) |
+                                 Q(path__startswith=newpath + '/'),
+                                 language=language
+                                 ).values_list('node_id', 'path')
+    path_cache.invalidate((node_id, language, oldpath + path[len(newpath):])
+                          for (node_id, path) in moved)
+
+@receiver(post_delete, sender=Paths,
+          dispatch_uid="wheelcms_axle.node.invalidate_deleted_path")
+def invalidate_deleted_path(sender, instance, **kwargs):
+    """ invalidate the cached path of removed nodes """
+    path_cache.invalidate([(instance.node_id, instance.language,
+                            instance.path)])
+
+@receiver(subtree_removed, dispatch_uid="wheelcms_axle.node.invalidate_removed_paths")
+def invalidate_removed_paths(sender, paths, **kwargs):
+    """ invalidate the cached paths of a removed subtree """
+    path_cache.invalidate(paths)
@@ -0,0 +1,212 @@
+"""
+    An opt-in cache of fully rendered pages for anonymous visitors, keyed
+    by (host, language, path, action)
+
+    Enable it by setting WHEEL_PAGE_CACHE to the alias of one of the
+    configured CACHES, or to True to use a local memory cache (which is
+    only safe if a single process modifies the site). Pages stay fresh for
+    WHEEL_PAGE_CACHE_TIMEOUT seconds (default 300) and may be served stale
+    for WHEEL_PAGE_CACHE_STALE more seconds (default 0) while a single
+    request regenerates them.
+
+    Pages contain navigation and listings of other content, so any change
+    to content, the tree, permissions or the configuration invalidates all
+    cached pages at once by bumping a generation counter. Pages are never
+    kept (or served stale) past the next publication or expiry moment.
+
+    Only responses rendered for anonymous users are stored, so a cached
+    page never shows more than has_access allowed anonymous to see.
+
+    Regardless of WHEEL_PAGE_CACHE, the same changes bump a site
+    generation in the default cache, which identifies the state of the
+    site in the validators of conditional responses. The default cache
+    must be shared if more than one process modifies the site.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import get_cache, cache
+from django.contrib import messages
+from django.http import HttpResponse
+from django.utils import timezone
+
+
+class PageCache(object):
+    """ stores rendered anonymous responses in a django cache backend """
+    generation_key = "wheelcms:pages:generation"
+    site_generation_key = "wheelcms:site:generation"
+    generation_timeout = 30 * 24 * 3600
+    ## stored along with the page so cached pages remain conditional
+    headers = ('ETag', 'Last-Modified')
+
+    def __init__(self, backend=None):
+        self._backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self):
+        return bool(getattr(settings, 'WHEEL_PAGE_CACHE', False))
+
+    @property
+    def timeout(self):
+        return getattr(settings, 'WHEEL_PAGE_CACHE_TIMEOUT', 300)
+
+    @property
+    def stale(self):
+        return getattr(settings, 'WHEEL_PAGE_CACHE_STALE', 0)
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            alias = getattr(settings, 'WHEEL_PAGE_CACHE', None)
+            if alias and alias is not True:
+                self._backend = get_cache(alias)
+            else:
+                self._backend = get_cache(
+                    'django.core.cache.backends.locmem.LocMemCache',
+                    LOCATION='wheelcms-pages')
+        return self._backend
+
+    def cacheable(self, request):
+        """ only plain anonymous GETs without messages to show """
+        return self.enabled and request.method == "GET" and \
+               not request.GET and \
+               not request.user.is_authenticated() and \
+               not len(messages.get_messages(request))
+
+    def key(self, request, language, path, action=""):
+        ## hash it, paths may be too long or contain invalid characters
+        ## for memcached
+        raw = u"%s:%s:%s:%s" % (request.get_host(), language,
+                                path.strip('/'), action or "")
+        return "wheelcms:page:" + hashlib.md5(raw.encode('utf8')).hexdigest()
+
+    def get(self, key):
+        """
+            Return the cached response or None if it needs to be
+            (re)generated. Stale entries are served to everyone but the
+            first request to find them stale.
+        """
+        found = self.backend.get_many([self.generation_key, key])
+        entry = found.get(key)
+        if entry is None or \
+           entry['generation'] != found.get(self.generation_key):
+            self.misses += 1
+            return None
+
+        now = time.time()
+        if now >= entry['fresh_until']:
+            if now >= entry['stale_until'] or \
+               self.backend.add(key + ":refresh", True, 30):
+                self.misses += 1
+                return None
+
+        self.hits += 1
+        response = HttpResponse(entry['content'],
+                                content_type=entry['content_type'])
+        for header, value in entry['headers']:
+            response[header] = value
+        response['X-Wheel-Cache'] = 'hit'
+        return response
+
+    def set(self, key, request, response):
+        """ store response if it's a complete, cookie-less page """
+        if not isinstance(response, HttpResponse) or \
+           response.status_code != 200 or \
+           getattr(response, 'streaming', False) or \
+           response.cookies or \
+           request.META.get("CSRF_COOKIE_USED") or \
+           len(messages.get_messages(request)):
+            return False
+
+        generation = self.generation()
+
+        now = time.time()
+        fresh = self.timeout
+        stale = self.stale
+        boundary = self.next_boundary()
+        if boundary is not None:
+            ## never serve content past its publication/expiry moment
+            remaining = max(0, int((boundary - timezone.now()).total_seconds()))
+            if remaining < fresh + stale:
+                fresh = min(fresh, remaining)
+                stale = remaining - fresh
+
+        if fresh <= 0:
+            return False
+
+        self.backend.set(key, dict(generation=generation,
+                                   fresh_until=now + fresh,
+                                   stale_until=now + fresh + stale,
+                                   content=response.content,
+                                   content_type=response['Content-Type'],
+                                   headers=[(h, response[h])
+                                            for h in self.headers
+                                            if h in response]),
+                         fresh + stale)
+        self.backend.delete(key + ":refresh")
+        return True
+
+    def next_boundary(self):
+        """ the first upcoming publication or expiry moment, if any """
+        from .content import Content
+
+        now = timezone.now()
+        upcoming = []
+        for field in ('publication', 'expire'):
+            upcoming.extend(Content.objects.filter(**{field + '__gt':now})
+                            .order_by(field).values_list(field, flat=True)[:1])
+        return min(upcoming) if upcoming else None
+
+    def generation(self):
+        """
+            The current generation, which is (re)initialized from the
+            clock so a lost counter never revalidates older entries
+        """
+        generation = self.backend.get(self.generation_key)
+        if generation is None:
+            self.backend.add(self.generation_key, int(time.time() * 1000),
+                             self.generation_timeout)
+            generation = self.backend.get(self.generation_key)
+        return generation
+
+    def site_generation(self):
+        """
+            The current site generation, kept in the default cache
+            whether or not pages are cached
+        """
+        generation = cache.get(self.site_generation_key)
+        if generation is None:
+            cache.add(self.site_generation_key, int(time.time() * 1000),
+                      self.generation_timeout)
+            generation = cache.get(self.site_generation_key)
+        return generation
+
+    def invalidate(self):
+        """ invalidate all cached pages (and validators) """
+        try:
+            cache.incr(self.site_generation_key)
+        except ValueError:
+            self.site_generation()
+        if not self.enabled:
+            return
+        try:
+            self.backend.incr(self.generation_key)
+        except ValueError:
+            self.generation()
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return dict(hits=self.hits, misses=self.misses,
+                    ratio=float(self.hits) / total if total else 0.0)
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+
+page_cache = PageCache()
@@ -0,0 +1,71 @@
+"""
+    Caches the localized paths of nodes: (node id, language) -> path.
+    (Looking up a node by path takes a single query anyway, which also
+    fetches the node)
+
+    By default a local memory cache is used. Set WHEEL_PATH_CACHE to the
+    alias of one of the configured CACHES to share it between processes,
+    which is required if more than one process can modify the tree.
+"""
+from django.conf import settings
+from django.core.cache import get_cache
+
+class PathCache(object):
+    """ a thin wrapper around a django cache backend that keeps track of
+        hits and misses """
+
+    def __init__(self, backend=None):
+        self._backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            alias = getattr(settings, 'WHEEL_PATH_CACHE', None)
+            if alias:
+                self._backend = get_cache(alias)
+            else:
+                self._backend = get_cache(
+                    'django.core.cache.backends.locmem.LocMemCache',
+                    LOCATION='wheelcms-paths', TIMEOUT=3600)
+        return self._backend
+
+    def node_key(self, node_id, language):
+        return u"wheelcms:path:%s:%s" % (node_id, language)
+
+    def _get(self, key):
+        value = self.backend.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def get_path(self, node_id, language):
+        """ the path of the node, or None if not cached """
+        return self._get(self.node_key(node_id, language))
+
+    def set(self, node_id, language, path):
+        self.backend.set(self.node_key(node_id, language), path)
+
+    def invalidate(self, entries):
+        """ invalidate a sequence of (node id, language, path) """
+        keys = [self.node_key(node_id, language)
+                for node_id, language, path in entries]
+        if keys:
+            self.backend.delete_many(keys)
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return dict(hits=self.hits, misses=self.misses,
+                    ratio=float(self.hits) / total if total else 0.0)
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+
+path_cache = PathCache()
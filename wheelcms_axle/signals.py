@@ -3,3 +3,13 @@ import django.dispatch
 state_changed = django.dispatch.Signal(providing_args=["oldstate", "newstate"])
 
 
+## sent once per language when the paths of a node and all of its
+## offspring have been rewritten from oldpath to newpath
+paths_changed = django.dispatch.Signal(providing_args=["node", "language",
+                                                       "oldpath", "newpath"])
+
+## sent once after a node and its offspring have been deleted in bulk,
+## with the ids of the deleted nodes, their (node id, language, path)
+## and the (model, pk) of their content
+subtree_removed = django.dispatch.Signal(providing_args=["node", "nodes",
+                                                         "paths", "content"])
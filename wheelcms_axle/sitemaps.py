@@ -18,6 +18,7 @@ class ContentSitemap(Sitemap):
         return Content.objects.filter(node__isnull=False,
                                       language=language,
                                       state='published',
+                                      anonymous_view=True,
                                       publication__lte=now,
                                       expire__gte=now)
 
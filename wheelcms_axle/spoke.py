@@ -1,7 +1,6 @@
 import inspect
 
 from django.contrib.auth.models import User
-from django.http import HttpResponse
 from django.conf import settings
 
 from taggit.models import Tag
@@ -9,7 +8,7 @@ from taggit.models import Tag
 from haystack import indexes
 
 
-from wheelcms_axle.content import Content
+from wheelcms_axle.content import Content, ImageContent
 from wheelcms_axle.node import Node
 from wheelcms_axle.forms import formfactory, FileFormfactory
 
@@ -25,6 +24,7 @@ from .impexp import WheelSerializer
 from .actions import action, tab
 
 from .utils import classproperty, json
+from . import conditional, delivery, derivatives
 
 from warnings import warn
 
@@ -88,7 +88,8 @@ def indexfactory(spoke):
                 Or index everything and apply filters depending on
                 context? """
             ## only index content that's attached.
-            return spoke.model.objects.filter(node__isnull=False)
+            return spoke.model.objects.filter(node__isnull=False
+                                              ).select_related('node')
 
         def get_model(self):
             return spoke.model
@@ -213,6 +214,19 @@ class Spoke(ContextWrappable):
         """ Update specific permissions, e.g. after a workflow change """
         auth.update_perms(self.instance, perms)
 
+    def initial_perms(self):
+        """ the assignments of new content: the class' assignments, with
+            those of the workflow for its state taking precedence """
+        perms = dict(self.permission_assignment)
+        perms.update(self.workflow().permission_assignment.get(
+                         self.instance.state) or {})
+        return perms
+
+    def assign_initial_perms(self):
+        """ invoked by a signal handler upon creation: assign all initial
+            permissions at once """
+        auth.assign_perms(self.instance, self.initial_perms(), new=True)
+
     @property
     def o(self):
         warn("{0}.o is obsolete, please use {0}.instance".format(self),
@@ -469,6 +483,11 @@ class Spoke(ContextWrappable):
                 perm, role = assignment.split('/', 1)
                 RolePermission.assign(self.instance, Role(role),
                                       Permission(perm)).save()
+            ## deleting assignments doesn't invalidate the page cache
+            auth.assignments_changed()
+            auth.update_summary(self.instance)
+            ## the rest of the request sees the new assignments
+            auth.forget_roles(request)
 
         ctx = {'spoke':self}
 
@@ -516,21 +535,57 @@ class FileSpoke(Spoke):
     def download(self, handler, request, action):
         """ provide a direct download
 
-            What's the best option: redirect to {{MEDIA_URL}}/<path> or
-            serve from the cms? The former is far more efficient (can be handled
-            by the application server), the latter allows more restrictions,
-            headers, mangling, etc.
-
-            For now, let's choose the inefficient option
+            Permissions are checked by the cms, the transfer itself is
+            handled by the configured delivery (see delivery.py), which
+            streams the file or offloads it to the web server
         """
         ## test workflow state / permissions! XXX
 
+        ## the file doesn't depend on language, template or roles
+        etag = conditional.make_etag(self.instance.pk, self.instance.modified,
+                                     self.instance.storage.name)
+        last_modified = self.instance.modified
+        unchanged = conditional.not_modified(request, etag, last_modified)
+        if unchanged:
+            return unchanged
+
         filename = self.instance.filename or self.instance.title
         content_type = self.instance.content_type or "application/octet-stream"
 
-        response = HttpResponse(self.instance.storage, content_type=content_type)
-        response['Content-Type'] = content_type
+        response = delivery.get_delivery().response(request,
+                                                    self.instance.storage,
+                                                    content_type,
+                                                    etag, last_modified)
 
         response['Content-Disposition'] = 'attachment; filename=%s' % filename
-        return response
+        return conditional.set_validators(response, etag, last_modified)
+
+    @action
+    def image(self, handler, request, action):
+        """ serve a scaled down version of an image, +image/<size> """
+        size = action.partition('/')[2]
+        if not isinstance(self.instance, ImageContent) or \
+           size not in derivatives.sizes():
+            return handler.notfound()
+
+        try:
+            rendition = derivatives.derivative(self.instance.storage, size)
+        except IOError:
+            ## not an image PIL can read
+            return handler.notfound()
+
+        etag = conditional.make_etag(rendition.name)
+        last_modified = self.instance.modified
+        unchanged = conditional.not_modified(request, etag, last_modified)
+        if unchanged:
+            return unchanged
+
+        content_type = self.instance.content_type or "application/octet-stream"
+        response = delivery.get_delivery().response(request, rendition,
+                                                    content_type,
+                                                    etag, last_modified)
+        if request.GET.get('v') == derivatives.token(self.instance.storage):
+            ## versioned url, will never change
+            response['Cache-Control'] = 'public, max-age=31536000'
+        return conditional.set_validators(response, etag, last_modified)
 
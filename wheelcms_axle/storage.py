@@ -0,0 +1,173 @@
+"""
+    Content addressed, deduplicating file storage
+
+    Files are stored under the hash of their contents, so identical
+    uploads share a single blob on disk. Use it for (File)Content storage
+    fields, e.g.
+
+        storage = models.FileField(upload_to="files",
+                                   storage=ContentAddressedStorage())
+
+    or for all file fields by setting DEFAULT_FILE_STORAGE to
+    "wheelcms_axle.storage.ContentAddressedStorage".
+
+    A blob is deleted as soon as the last row referring to it is deleted.
+    Rows removed in bulk (e.g. by Node.delete_subtree) or files replaced
+    by new uploads leave unreferenced blobs behind, which the "collectblobs"
+    management command removes.
+
+    Blobs never change once written, so they can safely be hardlinked
+    (see the export command's --link option).
+"""
+import hashlib
+import os
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db.models import FileField
+from django.db.models.signals import class_prepared, post_delete
+
+
+class UploadFileSystemStorage(FileSystemStorage):
+    """
+        Moves staged (streamed or temporary) uploads into place in stead of
+        copying them. Django passes them wrapped in a FieldFile, which hides
+        their temporary_file_path()
+
+        Unless given explicitly, location and base_url follow MEDIA_ROOT
+        and MEDIA_URL, even when these change after the storage was
+        created along with its model (e.g. in tests)
+    """
+    def __init__(self, location=None, base_url=None, *args, **kw):
+        super(UploadFileSystemStorage, self).__init__(location, base_url,
+                                                      *args, **kw)
+        if location is None:
+            self._location = None
+        if base_url is None:
+            self._base_url = None
+
+    @property
+    def location(self):
+        if self._location is None:
+            return os.path.abspath(settings.MEDIA_ROOT)
+        return self._location
+
+    @location.setter
+    def location(self, value):
+        self._location = value
+
+    @property
+    def base_url(self):
+        if self._base_url is None:
+            return settings.MEDIA_URL
+        return self._base_url
+
+    @base_url.setter
+    def base_url(self, value):
+        self._base_url = value
+
+    def _save(self, name, content):
+        staged = getattr(content, 'file', None)
+        if hasattr(staged, 'temporary_file_path'):
+            content = staged
+        return super(UploadFileSystemStorage, self)._save(name, content)
+
+class ContentAddressedStorage(UploadFileSystemStorage):
+    """ stores files as blobs/<aa>/<bb>/<sha1><ext> """
+    prefix = "blobs"
+
+    def digest(self, content):
+        ## streamed uploads have been hashed while being received
+        staged = getattr(content, 'file', content)
+        if getattr(staged, 'sha1', None):
+            return staged.sha1
+        sha1 = hashlib.sha1()
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        for chunk in content.chunks():
+            sha1.update(chunk)
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        return sha1.hexdigest()
+
+    def blob_name(self, digest, name):
+        """ keep the extension, it's used to guess the mimetype """
+        extension = os.path.splitext(name)[1].lower()
+        return "/".join((self.prefix, digest[:2], digest[2:4],
+                         digest + extension))
+
+    def save(self, name, content):
+        name = self.blob_name(self.digest(content), name or "")
+        if self.exists(name):
+            return name
+        return super(ContentAddressedStorage, self).save(name, content)
+
+    def plain(self):
+        """ a storage for the same location that keeps names as given,
+            for files that aren't blobs (e.g. image derivatives) """
+        return UploadFileSystemStorage(self._location, self._base_url)
+
+    def blobs(self):
+        """ the names of all stored blobs """
+        for dirpath, dirnames, filenames in os.walk(self.path(self.prefix)):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                yield os.path.relpath(path, self.location).replace(os.sep,
+                                                                   "/")
+
+
+## the (model, field name) of all file fields using a content addressed
+## storage, collected as models are defined
+blob_fields = []
+
+def uses_blobs(field):
+    return isinstance(field, FileField) and \
+           isinstance(field.storage, ContentAddressedStorage)
+
+def references(name):
+    """ the number of rows referring to the blob """
+    return sum(model._default_manager.filter(**{fieldname: name}).count()
+               for (model, fieldname) in blob_fields)
+
+def referenced():
+    """ the names of all blobs in use """
+    names = set()
+    for model, fieldname in blob_fields:
+        names.update(model._default_manager.values_list(fieldname,
+                                                        flat=True))
+    return names
+
+def collect_garbage(storage, dry_run=False):
+    """ delete the blobs in storage no longer referred to """
+    used = referenced()
+    removed = [name for name in storage.blobs() if name not in used]
+    if not dry_run:
+        for name in removed:
+            storage.delete(name)
+    return removed
+
+def release_blobs(sender, instance, **kwargs):
+    """ delete the blobs of a deleted row unless still referenced """
+    for field in sender._meta.fields:
+        if not uses_blobs(field):
+            continue
+        name = getattr(instance, field.attname)
+        name = getattr(name, 'name', name)
+        if name and not references(name):
+            field.storage.delete(name)
+
+def register_blob_fields(sender, **kwargs):
+    """ connected to class_prepared; per model so other models keep
+        their fast (bulk) deletes """
+    fields = [f for f in sender._meta.fields if uses_blobs(f)]
+    if sender._meta.abstract or not fields:
+        return
+    for field in fields:
+        blob_fields.append((sender, field.name))
+    post_delete.connect(release_blobs, sender=sender,
+                        dispatch_uid="wheelcms_axle.storage.release_blobs.%s.%s"
+                                     % (sender._meta.app_label,
+                                        sender._meta.object_name))
+
+class_prepared.connect(register_blob_fields,
+                       dispatch_uid="wheelcms_axle.storage.register_blob_fields")
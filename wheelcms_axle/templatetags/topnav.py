@@ -15,16 +15,24 @@ def navigation_items(request, node):
     ## remove visible_children? Unnecessary with permission checks
 
     ## Find top/secondlevel published nodes in one query XXX
-    for toplevel in queries.toplevel_visible_children(language=language):
+    toplevels = [(toplevel, toplevel.content(language=language))
+                 for toplevel in queries.toplevel_visible_children(
+                     language=language).with_content(language)]
+    toplevels = accessible(request, toplevels)
+
+    ## check all secondlevel items at once as well
+    secondlevels = {}
+    for toplevel, content in toplevels:
+        secondlevels[toplevel.pk] = [
+            (secondlevel, secondlevel.content(language=language))
+            for secondlevel in queries.get_visible_children(toplevel,
+                                   language=language).with_content(language)]
+    allowed = set(secondlevel.pk for secondlevel, content in
+                  accessible(request, sum(secondlevels.values(), [])))
+
+    for toplevel, content in toplevels:
         ## make sure /foo/bar does not match in /football by adding the /
         item = dict(active=False, node=toplevel)
-        content = toplevel.content(language=language)
-
-        if content:
-            spoke = content.spoke()
-            perm = spoke.permissions.get('view')
-            if not auth.has_access(request, spoke, spoke, perm):
-                continue
 
         item['url'] = toplevel.get_absolute_url(language=language)
         item['title'] = content.title if content else ""
@@ -34,13 +42,10 @@ def navigation_items(request, node):
             item['active'] = True
 
         sub = []
-        for secondlevel in queries.get_visible_children(toplevel, language=language):
-            slitem = dict(node=secondlevel)
-            content = secondlevel.content(language=language)
-            spoke = content.spoke()
-            perm = spoke.permissions.get('view')
-            if not auth.has_access(request, spoke, spoke, perm):
+        for secondlevel, content in secondlevels[toplevel.pk]:
+            if secondlevel.pk not in allowed:
                 continue
+            slitem = dict(node=secondlevel)
 
             slitem['url'] = secondlevel.get_absolute_url(language=language)
             slitem['title'] = content.title if content else ""
@@ -51,6 +56,16 @@ def navigation_items(request, node):
         nav.append(item)
     return dict(toplevel=nav)
 
+def accessible(request, items):
+    """ the (node, content) items the user may view. Unattached nodes
+        require no permission """
+    spokes = auth.has_access_many(request,
+                                  [content.spoke() for (node, content)
+                                   in items if content])
+    allowed = set(spoke.instance.pk for spoke in spokes)
+    return [(node, content) for (node, content) in items
+            if not content or content.pk in allowed]
+
 @register.inclusion_tag('wheelcms_axle/topnav.html', takes_context=True)
 def topnav(context):
     request = context.get('request')
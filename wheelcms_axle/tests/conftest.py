@@ -1,2 +1,17 @@
 from twotest.fixtures import client, django_client
 from .fixtures import root, localtyperegistry, localtemplateregistry, defaultworkflow, localactionregistry
+
+import pytest
+
+@pytest.fixture(autouse=True)
+def clear_path_cache():
+    """ node ids are reused after the database is flushed """
+    from wheelcms_axle.pathcache import path_cache
+    path_cache.clear()
+    path_cache.reset_stats()
+
+@pytest.fixture(autouse=True)
+def clear_page_cache():
+    from wheelcms_axle.pagecache import page_cache
+    page_cache.clear()
+    page_cache.reset_stats()
@@ -26,7 +26,9 @@ def toolbar_registry():
 @pytest.fixture()
 def localtyperegistry(request):
     registry = TypeRegistry()
+    original = type_registry.__wrapped__
     type_registry.set(registry)
+    request.addfinalizer(lambda: type_registry.set(original))
     if hasattr(request.cls, 'type') and request.cls.type:
         registry.register(request.cls.type)
     if hasattr(request.cls, 'other') and request.cls.other:
@@ -1,6 +1,7 @@
 from wheelcms_axle.content import Content, FileContent, ImageContent
 from wheelcms_axle.spoke import Spoke, action, FileSpoke
 from wheelcms_axle.content import type_registry
+from wheelcms_axle.storage import ContentAddressedStorage
 
 from django.db import models
 
@@ -58,6 +59,15 @@ class OtherTestImageType(FileSpoke):
     model = OtherTestImage
     children = ()
 
+class BlobFile(FileContent):
+    storage = models.FileField(upload_to="files", blank=False,
+                               storage=ContentAddressedStorage())
+
+
+class BlobFileType(FileSpoke):
+    model = BlobFile
+    children = ()
+
 class TypeM2M(Content):
     m2m = models.ManyToManyField("self")
 
@@ -70,6 +80,14 @@ class TypeUnique(Content):
 class TypeUniqueType(Spoke):
     model = TypeUnique
 
+class Reference(models.Model):
+    """ refers to content without being deleted along with it """
+    optional = models.ForeignKey(Content, null=True, related_name="+",
+                                 on_delete=models.SET_NULL)
+    protected = models.ForeignKey(Content, null=True,
+                                  related_name="protected_by",
+                                  on_delete=models.PROTECT)
+
 type_registry.register(Type1Type)
 type_registry.register(Type2Type)
 type_registry.register(TestFileType)
@@ -78,6 +96,7 @@ type_registry.register(OtherTestFileType)
 type_registry.register(OtherTestImageType)
 type_registry.register(TypeM2MType)
 type_registry.register(TypeUniqueType)
+type_registry.register(BlobFileType)
 
 from wheelcms_axle.models import Configuration as BaseConfiguration
 from wheelcms_axle.registries.configuration import configuration_registry
@@ -4,6 +4,9 @@
 """
 from mock import patch, PropertyMock, MagicMock
 import pytest
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from twotest.util import create_request
 
 from django.contrib.auth.models import User, Group
@@ -13,9 +16,11 @@ from drole.models import RolePermission
 from wheelcms_axle import permissions as p, roles
 from wheelcms_axle import models
 
-from .models import Type1Type
+from .models import Type1Type, TestFile, TestFileType
+from .test_spoke import filedata
 from ..auth import has_access, Permission, Role, assign_perms, update_perms
-from ..auth import get_roles_in_context, assign
+from ..auth import get_roles_in_context, assign, forget_roles
+from ..auth import has_access_many
 
 from .fixtures import superuser
 
@@ -255,6 +260,293 @@ class TestRolesContext(object):
 
     ## superuser -- all roles, or always access?
 
+@pytest.mark.usefixtures("localtyperegistry")
+class TestRolesCache(object):
+    """ roles are resolved once per request (and instance) """
+    type = Type1Type
+
+    def test_global_once(self, client, auth_request):
+        get_roles_in_context(auth_request, Type1Type)
+        with CaptureQueriesContext(connection) as queries:
+            get_roles_in_context(auth_request, Type1Type)
+        assert len(queries) == 0
+
+    def test_local_once(self, client, auth_request):
+        spoke = Type1Type.create(owner=auth_request.user).save()
+        get_roles_in_context(auth_request, Type1Type, spoke)
+        with CaptureQueriesContext(connection) as queries:
+            assert roles.owner in \
+                   get_roles_in_context(auth_request, Type1Type, spoke)
+        assert len(queries) == 0
+
+    def test_local_per_instance(self, client, auth_request):
+        """ local roles of one instance don't leak into another """
+        mine = Type1Type.create(owner=auth_request.user).save()
+        other = Type1Type.create().save()
+        assert roles.owner in get_roles_in_context(auth_request, Type1Type,
+                                                   mine)
+        assert roles.owner not in get_roles_in_context(auth_request,
+                                                       Type1Type,
+                                                       other)
+        assert roles.owner not in get_roles_in_context(auth_request,
+                                                       Type1Type)
+
+    def test_per_request(self, client, auth_request):
+        """ a new request sees newly assigned roles """
+        get_roles_in_context(auth_request, Type1Type)
+        models.Role.objects.get_or_create(user=auth_request.user,
+                                          role=Role("special.role"))
+        other_request = create_request("GET", "/")
+        other_request.user = auth_request.user
+        assert Role("special.role") in \
+               get_roles_in_context(other_request, Type1Type)
+
+    def test_forget(self, client, auth_request):
+        get_roles_in_context(auth_request, Type1Type)
+        models.Role.objects.get_or_create(user=auth_request.user,
+                                          role=Role("special.role"))
+        forget_roles(auth_request)
+        assert Role("special.role") in \
+               get_roles_in_context(auth_request, Type1Type)
+
+    def test_forget_on_assignment(self, client, auth_request):
+        """ changing the assignments (Roles/Perms tab) drops the cache """
+        spoke = Type1Type.create(owner=auth_request.user).save()
+        request = create_request("POST", "/+auth", data={})
+        request.user = auth_request.user
+        get_roles_in_context(request, Type1Type, spoke)
+        spoke.auth(MagicMock(), request, "auth")
+        with CaptureQueriesContext(connection) as queries:
+            assert roles.owner in get_roles_in_context(request, Type1Type,
+                                                       spoke)
+        assert len(queries) > 0
+
+    def test_user_change(self, client, auth_request):
+        """ e.g. logging in during a request """
+        request = create_request("GET", "/")
+        assert roles.member not in get_roles_in_context(request, Type1Type)
+        request.user = auth_request.user
+        assert roles.member in get_roles_in_context(request, Type1Type)
+
+@pytest.mark.usefixtures("localtyperegistry")
+class TestAccessMany(object):
+    """ batched permission checks, equivalent to has_access """
+    type = Type1Type
+
+    def create(self, user, owned, published):
+        owner = user if owned else None
+        return [Type1Type.create(owner=owner,
+                                 state="published" if p else "private").save()
+                for p in published]
+
+    def test_anonymous(self, client, anon_request):
+        spokes = self.create(None, False, (True, False, True))
+        assert has_access_many(anon_request, spokes, p.view_content) == \
+               [spokes[0], spokes[2]]
+
+    def test_same_as_has_access(self, client, auth_request):
+        spokes = self.create(auth_request.user, True, (True, False)) + \
+                 self.create(auth_request.user, False, (True, False))
+        for permission in (p.view_content, p.edit_content, p.delete_content):
+            assert has_access_many(auth_request, spokes, permission) == \
+                   [s for s in spokes if has_access(auth_request, s, s,
+                                                    permission)]
+
+    def test_own_permission(self, client, anon_request):
+        """ without permission, each spoke's view permission is used """
+        spokes = self.create(None, False, (False, True))
+        assert has_access_many(anon_request, spokes) == [spokes[1]]
+
+    def test_superuser(self, client, super_request):
+        spokes = self.create(None, False, (True, False))
+        assert has_access_many(super_request, spokes, p.edit_content) == \
+               spokes
+
+    def test_inactive(self, client, auth_request):
+        spokes = self.create(auth_request.user, True, (True,))
+        auth_request.user.is_active = False
+        assert has_access_many(auth_request, spokes, p.view_content) == []
+        assert has_access_many(auth_request, spokes, p.public) == spokes
+
+    def test_single_query(self, client, auth_request):
+        spokes = self.create(auth_request.user, False, (True, False) * 5)
+        get_roles_in_context(auth_request, Type1Type)
+        with CaptureQueriesContext(connection) as queries:
+            assert len(has_access_many(auth_request, spokes,
+                                       p.view_content)) == 5
+        assert len(queries) == 1
+
+@pytest.mark.usefixtures("localtyperegistry")
+class TestAccessibleBy(object):
+    """ permission filtering by the database """
+    type = Type1Type
+    types = (TestFileType, )
+
+    def create(self, root, owner=None, states=("published", "private")):
+        return [Type1Type.create(node=root.add("c%d" % i), owner=owner,
+                                 state=state).save()
+                for i, state in enumerate(states)]
+
+    def test_anonymous(self, client, root, anon_request):
+        published, private = self.create(root)
+        assert list(models.Node.objects.accessible_by(anon_request)) == \
+               [published.instance.node]
+        assert list(models.Content.objects.accessible_by(anon_request)
+                    ) == [published.instance.content_ptr]
+
+    def test_owner(self, client, root, auth_request):
+        published, private = self.create(root, owner=auth_request.user)
+        assert set(models.Node.objects.accessible_by(auth_request)) == \
+               set((published.instance.node, private.instance.node))
+
+    def test_other(self, client, root, auth_request):
+        published, private = self.create(root, owner=user("other"))
+        assert list(models.Node.objects.accessible_by(auth_request)) == \
+               [published.instance.node]
+
+    def test_superuser(self, client, root, super_request):
+        self.create(root)
+        assert models.Node.objects.accessible_by(super_request).count() == 2
+
+    def test_inactive(self, client, root, auth_request):
+        self.create(root, owner=auth_request.user)
+        auth_request.user.is_active = False
+        assert not models.Node.objects.accessible_by(auth_request).exists()
+
+    def test_permission(self, client, root, anon_request):
+        self.create(root)
+        assert not models.Node.objects.accessible_by(anon_request,
+                                                     p.edit_content).exists()
+        assert models.Node.objects.accessible_by(anon_request,
+                                                 p.public).count() == 2
+
+    def test_language(self, client, root, anon_request):
+        """ the permission applies to the content in the language """
+        node = root.add("c")
+        Type1Type.create(node=node, language="en", state="published").save()
+        Type1Type.create(node=node, language="nl", state="private").save()
+
+        assert list(models.Node.objects.accessible_by(anon_request,
+                    language="en")) == [node]
+        assert not models.Node.objects.accessible_by(anon_request,
+                    language="nl").exists()
+
+    def test_file_content(self, client, root, anon_request):
+        """ also available on models deriving from abstract content """
+        published, private = [TestFileType.create(node=root.add(state),
+                                                  storage=filedata,
+                                                  state=state).save()
+                              for state in ("published", "private")]
+        assert list(TestFile.objects.accessible_by(anon_request)) == \
+               [published.instance]
+
+    def test_same_as_has_access_many(self, client, root, auth_request):
+        spokes = self.create(root, owner=auth_request.user) + \
+                 self.create(root.add("other"), owner=user("other"),
+                             states=("published", "private", "visible"))
+        for request in (auth_request, anon_request()):
+            expected = set(s.instance.pk for s in
+                           has_access_many(request, spokes, p.view_content))
+            assert set(models.Content.objects.accessible_by(request
+                       ).values_list('pk', flat=True)) == expected
+
+@pytest.mark.usefixtures("localtyperegistry")
+class TestSummary(object):
+    """ the anonymous_view summary of the assignments """
+    type = Type1Type
+
+    def stored(self, spoke):
+        return models.Content.objects.get(pk=spoke.instance.pk).anonymous_view
+
+    def test_create(self, client):
+        published = Type1Type.create(state="published").save()
+        private = Type1Type.create(state="private").save()
+        assert published.instance.anonymous_view
+        assert self.stored(published)
+        assert not private.instance.anonymous_view
+        assert not self.stored(private)
+
+    def test_state_change(self, client):
+        spoke = Type1Type.create(state="private").save()
+        spoke.instance.state = "published"
+        spoke.instance.save()
+        assert spoke.instance.anonymous_view
+        assert self.stored(spoke)
+
+        spoke.instance.state = "private"
+        spoke.instance.save()
+        assert not spoke.instance.anonymous_view
+        assert not self.stored(spoke)
+
+    def test_update_perms(self, client):
+        spoke = Type1Type.create(state="private").save()
+        update_perms(spoke.instance, {p.view_content: (roles.anonymous,)})
+        assert self.stored(spoke)
+        update_perms(spoke.instance, {p.view_content: (roles.owner,)})
+        assert not self.stored(spoke)
+
+    def test_other_permission(self, client):
+        """ assignments of other permissions leave the summary alone """
+        spoke = Type1Type.create(state="published").save()
+        with CaptureQueriesContext(connection) as queries:
+            assign_perms(spoke.instance, {p.edit_content: (roles.anonymous,)})
+        assert not [q for q in queries if "anonymous_view" in q['sql']]
+        assert self.stored(spoke)
+
+    def test_newpermission(self, client):
+        """ the command restores missing assignments through auth """
+        spoke = Type1Type.create(state="published").save()
+        RolePermission.clear(spoke.instance, p.view_content)
+        models.Content.objects.filter(pk=spoke.instance.pk
+                                      ).update(anonymous_view=False)
+
+        call_command("newpermission", p.view_content.id, verbose=False)
+        assert self.stored(spoke)
+        assert RolePermission.assignments(spoke.instance).filter(
+                   permission=p.view_content, role=roles.owner).exists()
+
+    def test_anonymous_has_access(self, client, anon_request):
+        published = Type1Type.create(state="published").save()
+        private = Type1Type.create(state="private").save()
+        with CaptureQueriesContext(connection) as queries:
+            assert has_access(anon_request, published, published,
+                              p.view_content)
+            assert not has_access(anon_request, private, private,
+                                  p.view_content)
+            assert has_access_many(anon_request, [published, private],
+                                   p.view_content) == [published]
+        assert len(queries) == 0
+
+    def test_anonymous_accessible_by(self, client, root, anon_request):
+        node = root.add("c")
+        Type1Type.create(node=node, state="published").save()
+        qs = models.Node.objects.accessible_by(anon_request)
+        assert "rolepermission" not in str(qs.query)
+        assert list(qs) == [node]
+
+@pytest.mark.usefixtures("localtyperegistry")
+class TestInitialPerms(object):
+    """ permissions assigned upon creation """
+    type = Type1Type
+
+    def test_matrix(self, client):
+        """ the workflow's assignment for the state takes precedence """
+        t = Type1Type.create(state="private").save()
+        expected = set((perm, role)
+                       for perm, roles in t.initial_perms().iteritems()
+                       for role in roles)
+        assert set((a.permission, a.role) for a in
+                   RolePermission.assignments(t.instance)) == expected
+        assert (p.view_content, roles.owner) in expected
+        assert (p.view_content, roles.anonymous) not in expected
+
+    def test_single_insert(self, client):
+        with CaptureQueriesContext(connection) as queries:
+            Type1Type.create(state="published").save()
+        inserts = [q for q in queries
+                   if 'INSERT INTO "drole_rolepermission"' in q['sql']]
+        assert len(inserts) == 1
+
 class TestAssignDecorator(object):
     """ Test the auth.assign class decorator """
     def test_base(self):
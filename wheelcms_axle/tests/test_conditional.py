@@ -0,0 +1,151 @@
+import pytest
+
+from django.http import HttpResponse
+from django.utils.http import http_date
+
+from twotest.util import create_request
+
+from wheelcms_axle.main import MainHandler
+from wheelcms_axle.conditional import timestamp
+from wheelcms_axle.tests.models import Type1, Type1Type
+from wheelcms_axle.tests.models import TestFile, TestFileType
+
+from .fixtures import active_language
+from .test_spoke import filedata
+
+
+class RenderingHandler(MainHandler):
+    """ renders a minimal page and counts how often it did """
+    rendered = 0
+
+    def template(self, path, **kw):
+        RenderingHandler.rendered += 1
+        return HttpResponse(self.content().title)
+
+
+def fetch(**headers):
+    request = create_request("GET", "/child", **headers)
+    return RenderingHandler().dispatch(request, nodepath="child")
+
+
+@pytest.mark.usefixtures("localtyperegistry", "active_language")
+class TestConditionalView(object):
+    """ content views answer conditional requests without rendering """
+    type = Type1Type
+
+    def setup_method(self, method):
+        RenderingHandler.rendered = 0
+
+    def page(self, root):
+        content = Type1(node=root.add("child"), title="Child",
+                        state="published")
+        content.save()
+        return content
+
+    def test_validators(self, client, root):
+        content = self.page(root)
+        response = fetch()
+        assert response['ETag']
+        assert response['Last-Modified'] == \
+               http_date(timestamp(content.modified))
+
+    def test_if_none_match(self, client, root):
+        self.page(root)
+        etag = fetch()['ETag']
+        response = fetch(HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 304
+        assert response['ETag'] == etag
+        assert RenderingHandler.rendered == 1
+
+    def test_if_modified_since(self, client, root):
+        self.page(root)
+        last_modified = fetch()['Last-Modified']
+        response = fetch(HTTP_IF_MODIFIED_SINCE=last_modified)
+        assert response.status_code == 304
+        assert RenderingHandler.rendered == 1
+
+    def test_changed(self, client, root):
+        content = self.page(root)
+        etag = fetch()['ETag']
+        content.title = "Changed"
+        content.save()
+        response = fetch(HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 200
+        assert response['ETag'] != etag
+
+    def test_language(self, client, root):
+        """ the etag differs per language """
+        content = self.page(root)
+        etag = fetch()['ETag']
+        RenderingHandler.rendered = 0
+
+        from django.utils import translation
+        translation.activate('nl')
+        Type1(node=content.node, title="Kind", language="nl",
+              state="published").save()
+        response = fetch(HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 200
+        assert response.content == "Kind"
+
+    def test_role_set(self, client, root):
+        """ what anonymous has cached doesn't apply to a superuser """
+        from .test_handler import superuser_request
+        self.page(root)
+        etag = fetch()['ETag']
+
+        request = superuser_request("/child")
+        request.META['HTTP_IF_NONE_MATCH'] = etag
+        response = RenderingHandler().dispatch(request, nodepath="child")
+        assert response.status_code == 200
+
+    def test_user(self, client, root):
+        """ users with the same roles don't share each other's pages """
+        from django.contrib.auth.models import User
+        self.page(root)
+
+        def fetch_as(username, **headers):
+            request = create_request("GET", "/child", **headers)
+            request.user = User.objects.get_or_create(username=username)[0]
+            return RenderingHandler().dispatch(request, nodepath="child")
+
+        etag = fetch_as("alice")['ETag']
+        assert fetch_as("alice", HTTP_IF_NONE_MATCH=etag).status_code == 304
+        assert fetch_as("bob", HTTP_IF_NONE_MATCH=etag).status_code == 200
+
+    def test_site_changed(self, client, root):
+        """ navigation and listings show other content """
+        self.page(root)
+        etag = fetch()['ETag']
+        Type1(node=root.add("other"), title="Other",
+              state="published").save()
+        response = fetch(HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 200
+        assert response['ETag'] != etag
+
+    def test_site_removed(self, client, root):
+        self.page(root)
+        other = root.add("other")
+        Type1(node=other, title="Other", state="published").save()
+        etag = fetch()['ETag']
+        other.delete_subtree()
+        assert fetch(HTTP_IF_NONE_MATCH=etag).status_code == 200
+
+
+@pytest.mark.usefixtures("localtyperegistry")
+class TestConditionalDownload(object):
+    type = TestFileType
+
+    def test_download(self, client, root):
+        content = TestFile(node=root, storage=filedata, state="published")
+        content.save()
+        spoke = TestFileType(content)
+
+        response = spoke.download(None, create_request("GET", "/"),
+                                  "download")
+        assert response.status_code == 200
+        etag = response['ETag']
+
+        request = create_request("GET", "/", HTTP_IF_NONE_MATCH=etag)
+        response = spoke.download(None, request, "download")
+        assert response.status_code == 304
+        assert response.content == ""
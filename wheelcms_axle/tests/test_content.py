@@ -1,13 +1,19 @@
 import pytest
 
-from django.db import IntegrityError
+from django.db import IntegrityError, connection
+from django.db.models import ProtectedError
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from django.contrib.auth.models import User
+from drole.models import RolePermission
+from taggit.models import TaggedItem
 
-from wheelcms_axle.node import Node, NodeInUse
+from wheelcms_axle.node import Node, NodeInUse, Paths
+from wheelcms_axle.signals import subtree_removed
 from wheelcms_axle.content import Content, ContentCopyFailed
-from wheelcms_axle.content import ContentCopyNotSupported
+from wheelcms_axle.content import ContentCopyNotSupported, load_content
 from wheelcms_axle.tests.models import Type1, Type2, TypeM2M, TypeUnique
+from wheelcms_axle.tests.models import TestImage, TestImageType, Reference
 from wheelcms_axle.tests.models import Type1Type, Type2Type, TypeM2MType, TypeUniqueType
 
 from .fixtures import multilang_ENNL
@@ -171,6 +177,23 @@ class TestContent(object):
         c2 = c1.copy()
 
         assert set(c2.m2m.all()) == set((m2m1, m2m2))
+        assert c2 in m2m1.m2m.all()
+
+    def test_copy_content_m2m_node(self, client):
+        """ m2m relations are copied when copying a tree of content """
+        root = Node.root()
+        m2m1 = TypeM2M().save()
+        m2m2 = TypeM2M().save()
+        sub = root.add("sub")
+        Type1(title="content on sub", node=sub).save()
+        c1 = TypeM2M(title="m2m on sub/c1", node=sub.add("c1")).save()
+        c1.m2m = [m2m1, m2m2]
+
+        sub2, success, failed = root.paste(sub, copy=True)
+
+        c2 = sub2.child("c1").content()
+        assert c2 != c1
+        assert set(c2.m2m.all()) == set((m2m1, m2m2))
 
     def test_copy_content_unique(self, client):
         """ m2m relations need special handling """
@@ -215,6 +238,42 @@ class TestContent(object):
         assert sub2.child("c2").content() != subc2.content()
         assert sub2.child("c2").content().title == "content on sub/c2"
 
+    def test_copy_content_node_nested(self, client):
+        """ the structure of the copied tree is preserved """
+        root = Node.root()
+        sub = root.add("sub")
+        subc1 = sub.add("c1")
+        Type1(title="content on sub/c1", node=subc1).save()
+        subc1c1 = subc1.add("c1")
+        Type1(title="content on sub/c1/c1", node=subc1c1).save()
+        subc1c1.add("c1")
+
+        sub2, success, failed = root.paste(sub, copy=True)
+
+        assert len(sub2.children()) == 1
+        assert Node.get(sub2.path + "/c1").content().title == \
+               "content on sub/c1"
+        c1c1 = Node.get(sub2.path + "/c1/c1")
+        assert c1c1.content().title == "content on sub/c1/c1"
+        assert c1c1.content() != subc1c1.content()
+        assert c1c1.parent() == Node.get(sub2.path + "/c1")
+        assert Node.get(sub2.path + "/c1/c1/c1").depth == 4
+        assert set(success) == set((subc1.tree_path, subc1c1.tree_path))
+
+    def test_copy_content_node_progress(self, client):
+        """ copying reports its progress """
+        root = Node.root()
+        sub = root.add("sub")
+        Type1(title="content on sub", node=sub).save()
+        sub.add("c1").add("c1")
+        sub.add("c2")
+
+        progress = []
+        root.paste(sub, copy=True,
+                   progress=lambda done, total: progress.append((done, total)))
+
+        assert progress == [(1, 4), (2, 4), (3, 4), (4, 4)]
+
     def test_copy_content_node_unique(self, client):
         root = Node.root()
         sub = root.add("sub")
@@ -285,6 +344,155 @@ class TestContent(object):
         assert sub.primary_content()
         assert not sub.content(langauge="fr")
 
+@pytest.mark.usefixtures("localtyperegistry")
+class TestLoadContent(object):
+    """ test the polymorphic bulk loader """
+    types = (Type1Type, Type2Type, TestImageType)
+
+    def test_load_content(self, client):
+        """ content is resolved in order, using a query per type """
+        root = Node.root()
+        t1 = Type1(title="t1", node=root.add("a")).save()
+        t2 = Type2(title="t2", node=root.add("b")).save()
+        t3 = Type1(title="t3", node=root.add("c")).save()
+        img = TestImage(title="img", node=root.add("d")).save()
+
+        with CaptureQueriesContext(connection) as queries:
+            loaded = load_content(Content.objects.all().order_by("pk"))
+        assert len(queries) == 4
+        assert loaded == [t1, t2, t3, img]
+        assert [type(c) for c in loaded] == [Type1, Type2, Type1, TestImage]
+
+    def test_content_free(self, client):
+        """ content() on a resolved batch doesn't query """
+        root = Node.root()
+        Type1(title="t1", node=root.add("a")).save()
+        TestImage(title="img", node=root.add("b")).save()
+
+        bases = list(Content.objects.all())
+        load_content(bases)
+        with CaptureQueriesContext(connection) as queries:
+            resolved = [b.content() for b in bases]
+            resolved = [c.content() for c in resolved]
+        assert len(queries) == 0
+        assert set(type(c) for c in resolved) == set([Type1, TestImage])
+
+    def test_load_content_empty(self, client):
+        assert load_content([]) == []
+
+
+@pytest.mark.usefixtures("localtyperegistry")
+class TestDeleteSubtree(object):
+    """ test bulk subtree deletion """
+    types = (Type1Type, TypeM2MType, TestImageType)
+
+    def test_delete_subtree(self, client):
+        root = Node.root()
+        keep = root.add("keep")
+        k = Type1(title="keep", node=keep).save()
+        sub = root.add("sub")
+        t1 = Type1(title="t1", node=sub).save()
+        t1.tags.add("foo")
+        child = sub.add("child")
+        m1 = TypeM2M(title="m1", node=child).save()
+        m2 = TypeM2M(title="m2", node=child.add("m2")).save()
+        m1.m2m.add(m2)
+        km = TypeM2M(title="km", node=keep.add("km")).save()
+        km.m2m.add(m1)
+        img = TestImage(title="img", node=sub.add("img")).save()
+
+        assert sub.delete_subtree() == 4
+
+        assert list(Node.objects.all().order_by("tree_path")) == \
+               [root, keep, km.node]
+        assert set(Content.objects.all()) == set([k.content_ptr,
+                                                  km.content_ptr])
+        assert not TestImage.objects.exists()
+        assert not Paths.objects.filter(path__startswith="/sub").exists()
+        assert list(km.m2m.all()) == []
+        assert not RolePermission.objects.filter(object_id__in=[t1.pk,
+                                                 m1.pk, img.pk]).exists()
+        assert RolePermission.objects.filter(object_id=k.pk).exists()
+        assert not TaggedItem.objects.exists()
+
+    def test_delete_subtree_set_null(self, client):
+        """ references are handled according to their on_delete """
+        root = Node.root()
+        sub = root.add("sub")
+        t1 = Type1(title="t1", node=sub).save()
+        ref = Reference.objects.create(optional=t1)
+
+        sub.delete_subtree()
+
+        assert Reference.objects.get(pk=ref.pk).optional is None
+
+    def test_delete_subtree_protected(self, client):
+        root = Node.root()
+        sub = root.add("sub")
+        t1 = Type1(title="t1", node=sub.add("child")).save()
+        Reference.objects.create(protected=t1)
+
+        with pytest.raises(ProtectedError):
+            sub.delete_subtree()
+
+        assert Node.get("/sub/child").content() == t1
+
+    def test_delete_subtree_signal(self, client):
+        """ a single signal is sent for the subtree """
+        root = Node.root()
+        sub = root.add("sub")
+        t1 = Type1(title="t1", node=sub).save()
+        child = sub.add("child")
+        received = []
+
+        def handler(sender, **kw):
+            received.append(kw)
+
+        subtree_removed.connect(handler)
+        try:
+            sub.delete_subtree()
+        finally:
+            subtree_removed.disconnect(handler)
+
+        assert len(received) == 1
+        assert received[0]['node'] == sub
+        assert sorted(received[0]['nodes']) == sorted([sub.pk, child.pk])
+        assert received[0]['content'] == [(Type1, t1.pk)]
+        assert ("", "en", "/sub/child") not in received[0]['paths']
+        assert (child.pk, "en", "/sub/child") in received[0]['paths']
+
+    def test_delete_subtree_unindex(self, client):
+        """ the removed content is removed from the search index """
+        root = Node.root()
+        sub = root.add("sub")
+        t1 = Type1(title="t1", node=sub).save()
+        m1 = TypeM2M(title="m1", node=sub.add("child")).save()
+        index = mock.MagicMock()
+
+        with mock.patch("haystack.utils.loading.UnifiedIndex.get_index",
+                        return_value=index):
+            sub.delete_subtree()
+
+        removed = sorted((c[0][0].__class__, c[0][0].pk)
+                         for c in index.remove_object.call_args_list)
+        assert removed == sorted([(Type1, t1.pk), (TypeM2M, m1.pk)])
+
+    def test_delete_subtree_queries(self, client):
+        """ the number of queries doesn't depend on the size """
+        root = Node.root()
+
+        def count(parent, n):
+            for i in range(n):
+                Type1(title="t", node=parent.add("c%d" % i)).save()
+            with CaptureQueriesContext(connection) as queries:
+                parent.delete_subtree()
+            return len(queries)
+
+        ## warm up the content type cache
+        count(root.add("warmup"), 1)
+        assert count(root.add("small"), 2) == count(root.add("large"), 50)
+
+
 import mock
 import contextlib
 
@@ -0,0 +1,126 @@
+import pytest
+
+from django.conf import settings
+
+from twotest.util import create_request
+
+from wheelcms_axle.delivery import StreamingDelivery, get_delivery
+from wheelcms_axle.delivery import XSendfileDelivery, XAccelRedirectDelivery
+from wheelcms_axle.tests.models import TestFile, TestFileType
+
+from .test_spoke import filedata
+
+DATA = filedata.read()
+
+
+def body(response):
+    return "".join(response.streaming_content)
+
+def download(content, **headers):
+    return TestFileType(content).download(None,
+                                          create_request("GET", "/", **headers),
+                                          "download")
+
+
+@pytest.fixture()
+def stored(request, client, root):
+    filedata.seek(0)
+    content = TestFile(node=root, storage=filedata, state="published")
+    content.save()
+    return content
+
+@pytest.fixture()
+def delivery_settings(request):
+    def fin():
+        for name in ("WHEEL_FILE_DELIVERY", "WHEEL_ACCEL_REDIRECT_PREFIX"):
+            if hasattr(settings, name):
+                delattr(settings, name)
+    request.addfinalizer(fin)
+    return settings
+
+
+@pytest.mark.usefixtures("localtyperegistry")
+class TestStreamingDelivery(object):
+    """ files are streamed in chunks with support for byte ranges """
+    type = TestFileType
+
+    def test_full(self, stored):
+        response = download(stored)
+        assert response.status_code == 200
+        assert response['Content-Length'] == str(len(DATA))
+        assert response['Accept-Ranges'] == 'bytes'
+        assert 'attachment' in response['Content-Disposition']
+        assert body(response) == DATA
+
+    def test_chunked(self, stored):
+        delivery = StreamingDelivery()
+        delivery.chunk_size = 4
+        response = delivery.response(create_request("GET", "/"),
+                                     stored.storage, "image/png")
+        assert len(list(response.streaming_content)) == (len(DATA) + 3) // 4
+
+    def test_range(self, stored):
+        response = download(stored, HTTP_RANGE="bytes=2-5")
+        assert response.status_code == 206
+        assert response['Content-Range'] == 'bytes 2-5/%d' % len(DATA)
+        assert response['Content-Length'] == '4'
+        assert body(response) == DATA[2:6]
+
+    def test_range_open_ended(self, stored):
+        response = download(stored, HTTP_RANGE="bytes=10-")
+        assert response.status_code == 206
+        assert body(response) == DATA[10:]
+
+    def test_range_suffix(self, stored):
+        response = download(stored, HTTP_RANGE="bytes=-3")
+        assert body(response) == DATA[-3:]
+
+    def test_range_unsatisfiable(self, stored):
+        response = download(stored, HTTP_RANGE="bytes=1000-")
+        assert response.status_code == 416
+        assert response['Content-Range'] == 'bytes */%d' % len(DATA)
+
+    def test_range_multiple(self, stored):
+        """ multiple ranges aren't supported, the whole file is sent """
+        response = download(stored, HTTP_RANGE="bytes=0-1,4-5")
+        assert response.status_code == 200
+        assert body(response) == DATA
+
+    def test_if_range_mismatch(self, stored):
+        response = download(stored, HTTP_RANGE="bytes=2-5",
+                            HTTP_IF_RANGE='"outdated"')
+        assert response.status_code == 200
+
+    def test_if_range_match(self, stored):
+        etag = download(stored)['ETag']
+        response = download(stored, HTTP_RANGE="bytes=2-5",
+                            HTTP_IF_RANGE=etag)
+        assert response.status_code == 206
+
+
+@pytest.mark.usefixtures("localtyperegistry")
+class TestOffloadedDelivery(object):
+    """ the web server can take over the transfer """
+    type = TestFileType
+
+    def test_default(self, delivery_settings):
+        assert isinstance(get_delivery(), StreamingDelivery)
+
+    def test_sendfile(self, stored, delivery_settings):
+        delivery_settings.WHEEL_FILE_DELIVERY = "sendfile"
+        assert isinstance(get_delivery(), XSendfileDelivery)
+        response = download(stored)
+        assert response['X-Sendfile'] == stored.storage.path
+        assert response.content == ""
+
+    def test_accel(self, stored, delivery_settings):
+        delivery_settings.WHEEL_FILE_DELIVERY = "accel"
+        delivery_settings.WHEEL_ACCEL_REDIRECT_PREFIX = "/internal/"
+        response = download(stored)
+        assert response['X-Accel-Redirect'] == \
+               "/internal/" + stored.storage.name
+
+    def test_dotted_path(self, delivery_settings):
+        delivery_settings.WHEEL_FILE_DELIVERY = \
+            "wheelcms_axle.delivery.XAccelRedirectDelivery"
+        assert isinstance(get_delivery(), XAccelRedirectDelivery)
@@ -0,0 +1,155 @@
+from cStringIO import StringIO
+
+import mock
+
+import pytest
+
+from PIL import Image
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+
+from twotest.util import create_request
+
+from wheelcms_axle import derivatives
+from wheelcms_axle.tests.models import TestImage, TestImageType
+from wheelcms_axle.tests.models import TestFileType
+from wheelcms_axle.tests.models import BlobFile, BlobFileType
+from wheelcms_axle.storage import collect_garbage
+from wheelcms_axle.base import NotFound
+
+from .test_handler import MainHandlerTestable
+
+
+def image_upload(width, height, format="PNG", name="image.png"):
+    data = StringIO()
+    Image.new("RGB", (width, height), "red").save(data, format)
+    return SimpleUploadedFile(name, data.getvalue())
+
+def dimensions(field):
+    field.open('rb')
+    try:
+        return Image.open(field).size
+    finally:
+        field.close()
+
+
+@pytest.mark.usefixtures("localtyperegistry")
+class TestDerivatives(object):
+    """ scaled down versions of images """
+    types = (TestImageType, TestFileType, BlobFileType)
+
+    def image(self, root, width=800, height=600, **kw):
+        content = TestImage(node=root, storage=image_upload(width, height,
+                                                            **kw),
+                            state="published")
+        content.save()
+        return content
+
+    def test_derivative(self, client, root):
+        content = self.image(root)
+        thumb = derivatives.derivative(content.storage, "thumb")
+        assert thumb.name.startswith("derivatives/thumb/")
+        assert dimensions(thumb) == (60, 45)
+        assert dimensions(content.storage) == (800, 600)
+
+    def test_existing(self, client, root):
+        """ a derivative is generated only once """
+        content = self.image(root)
+        first = derivatives.derivative(content.storage, "small")
+        assert derivatives.derivative(content.storage, "small").name == \
+               first.name
+
+    def test_content_addressed(self, client, root):
+        """ derivatives of blobs are stored by name, once """
+        content = BlobFile(node=root, storage=image_upload(800, 600))
+        content.save()
+        thumb = derivatives.derivative(content.storage, "thumb")
+        assert thumb.name == derivatives.derivative_name(content.storage,
+                                                         "thumb")
+        assert dimensions(thumb) == (60, 45)
+
+        with mock.patch("PIL.Image.open") as m:
+            again = derivatives.derivative(content.storage, "thumb")
+        assert not m.called
+        assert again.name == thumb.name
+
+        ## they're not blobs, so not collected as garbage
+        collect_garbage(content.storage.storage)
+        assert content.storage.storage.exists(thumb.name)
+
+    def test_no_upscaling(self, client, root):
+        content = self.image(root, width=100, height=100)
+        assert derivatives.derivative(content.storage, "large").name == \
+               content.storage.name
+
+    def test_no_upscaling_remembered(self, client, root):
+        """ a small original is opened once to find out """
+        content = self.image(root, width=100, height=100)
+        derivatives.derivative(content.storage, "large")
+        with mock.patch("PIL.Image.open") as m:
+            assert derivatives.derivative(content.storage, "medium").name == \
+                   content.storage.name
+        assert not m.called
+
+    def test_jpeg(self, client, root):
+        content = self.image(root, format="JPEG", name="image.jpg")
+        medium = derivatives.derivative(content.storage, "medium")
+        assert dimensions(medium) == (250, 187)
+
+    def test_generate(self, client, root):
+        content = self.image(root)
+        generated = derivatives.generate(content.storage)
+        assert sorted(generated) == ["large", "medium", "small", "thumb"]
+
+    def test_new_version(self, client, root):
+        """ a new original gets new derivatives """
+        content = self.image(root)
+        old = derivatives.derivative(content.storage, "thumb")
+        content.storage = image_upload(1000, 1000)
+        content.save()
+        new = derivatives.derivative(content.storage, "thumb")
+        assert new.name != old.name
+        assert dimensions(new) == (60, 60)
+
+    def test_action(self, client, root):
+        content = self.image(root)
+        handler = MainHandlerTestable()
+        request = create_request("GET", "/+image/thumb")
+        response = TestImageType(content).image(handler, request,
+                                                "image/thumb")
+        assert response.status_code == 200
+        data = "".join(response.streaming_content)
+        assert Image.open(StringIO(data)).size == (60, 45)
+        assert 'Cache-Control' not in response
+
+    def test_action_versioned(self, client, root):
+        content = self.image(root)
+        url = derivatives.url(content, "thumb")
+        assert url.startswith("/+image/thumb?v=")
+        request = create_request("GET", url)
+        response = TestImageType(content).image(MainHandlerTestable(),
+                                                request, "image/thumb")
+        assert 'max-age' in response['Cache-Control']
+
+    def test_action_unknown_size(self, client, root):
+        content = self.image(root)
+        request = create_request("GET", "/+image/huge")
+        with pytest.raises(NotFound):
+            TestImageType(content).image(MainHandlerTestable(), request,
+                                         "image/huge")
+
+    def test_action_dispatch(self, client, root):
+        """ the size is passed along as part of the action """
+        self.image(root)
+        request = create_request("GET", "/+image/thumb")
+        response = MainHandlerTestable().dispatch(request, nodepath="",
+                                                  action="image/thumb")
+        assert response.status_code == 200
+
+    def test_command(self, client, root):
+        content = self.image(root)
+        call_command('derivatives', processes=1, verbose=False)
+        for size in ("thumb", "small", "medium", "large"):
+            name = derivatives.derivative_name(content.storage, size)
+            assert content.storage.storage.exists(name)
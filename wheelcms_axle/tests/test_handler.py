@@ -2,8 +2,11 @@
 import pytest
 from django.utils import translation
 from django.http import Http404
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
-from wheelcms_axle.main import MainHandler, handler
+from wheelcms_axle.main import MainHandler, handler, gethandler
+from wheelcms_axle.base import context
 from wheelcms_axle.models import Node
 from wheelcms_axle.tests.models import Type1, Type1Type
 from wheelcms_axle import locale
@@ -294,6 +297,115 @@ class TestMainHandler(object):
         # assert children[1]['node'] == u
         assert children[1]['node'].path == u.path
 
+    def test_handle_list_queries(self, client, root):
+        """ the number of queries doesn't depend on the number of
+            children """
+        def count(parent, n):
+            for i in range(n):
+                Type1(node=parent.add("child%d" % i),
+                      title="Child %d" % i).save()
+            parent.add("unattached")
+
+            ## warm up the user's profile
+            MainHandlerTestable().dispatch(
+                superuser_request(parent.path + "/list"),
+                nodepath=parent.path.lstrip('/'), handlerpath="list")
+
+            request = superuser_request(parent.path + "/list", method="GET")
+            handler = MainHandlerTestable()
+            with CaptureQueriesContext(connection) as queries:
+                res = handler.dispatch(request,
+                                       nodepath=parent.path.lstrip('/'),
+                                       handlerpath="list")
+            children = res['context']['children']
+            assert len(children) == n + 1
+            assert children[-1]['active'] is None
+            assert [c['active'].title for c in children[:-1]] == \
+                   ["Child %d" % i for i in range(n)]
+            return len(queries)
+
+        Type1(node=root, title="Root").save()
+        small = root.add("small")
+        Type1(node=small, title="Small").save()
+        large = root.add("large")
+        Type1(node=large, title="Large").save()
+
+        assert count(small, 5) == count(large, 500)
+
+
+@pytest.mark.usefixtures("localtyperegistry", "active_language")
+class TestQueryBudget(object):
+    """ a plain page view resolves its content and spoke only once """
+    type = Type1Type
+    budget = 10
+
+    def test_view_budget(self, client, root):
+        Type1(node=root, title="Root").save()
+        child = root.add("child")
+        Type1(node=child, title="Child").save()
+
+        ## warm up caches and the user's profile
+        MainHandlerTestable().dispatch(superuser_request("/child"),
+                                       nodepath="child")
+
+        request = superuser_request("/child")
+        handler = MainHandlerTestable()
+        with CaptureQueriesContext(connection) as queries:
+            res = handler.dispatch(request, nodepath="child")
+        assert res['context']['instance'] == child
+        assert len(queries) <= self.budget
+
+        ## the templates access these through the context, possibly
+        ## more than once
+        def access():
+            assert handler.page_title() == "Child"
+            assert handler.content().title == "Child"
+            assert handler.body_class()
+            assert handler.spoke().instance.title == "Child"
+            handler.tabs()
+
+        access()
+        with CaptureQueriesContext(connection) as queries:
+            access()
+        assert len(queries) == 0
+
+class TestDispatchTables(object):
+    """ handlers and context methods are scanned once per class """
+    def test_handlers(self):
+        handlers = MainHandlerTestable.dispatch_tables()['handlers']
+        assert handlers['reserved'] == 'handle_reserved'
+        assert handlers['decorated'] == 'decorated'
+        assert 'foobar' not in handlers
+
+    def test_cached_per_class(self):
+        tables = MainHandlerTestable.dispatch_tables()
+        assert MainHandlerTestable.dispatch_tables() is tables
+
+        class Sub(MainHandlerTestable):
+            @context
+            def extra(self):
+                return 1
+
+            def handle_extra(self):
+                pass
+
+        assert Sub.dispatch_tables() is not tables
+        assert 'extra' in Sub.dispatch_tables()['context']
+        assert 'extra' not in tables['context']
+        assert 'extra' in Sub.reserved()
+        assert 'extra' not in MainHandlerTestable.reserved()
+
+    def test_gethandler(self):
+        h = MainHandlerTestable()
+        assert gethandler(h, "reserved").__name__ == "handle_reserved"
+        assert gethandler(h, "decorated").__name__ == "decorated"
+        assert gethandler(h, "foobar") is None
+
+    def test_url_actions(self):
+        actions = MainHandler.url_actions()
+        assert "create" in actions
+        assert "edit" in actions
+        assert len(actions) == len(set(actions))
 
 @pytest.mark.usefixtures("localtyperegistry")
 class TestBreadcrumb(object):
@@ -374,6 +486,26 @@ class TestBreadcrumb(object):
             ("Child", child.get_absolute_url()),
             ("Child2", child2.get_absolute_url()), ("Edit", "")]
 
+    def test_queries_constant(self, client, root):
+        """ the number of queries doesn't depend on the depth """
+        Type1(node=root, title="Root").save()
+        node = root
+        nodes = []
+        for i in range(6):
+            node = node.add("child%d" % i)
+            Type1(node=node, title="Child %d" % i).save()
+            nodes.append(node)
+        request = create_request("GET", "/")
+
+        def count(node):
+            handler = MainHandlerTestable(request=request, instance=node)
+            with CaptureQueriesContext(connection) as queries:
+                crumbs = handler.breadcrumb()
+            assert len(crumbs) == node.depth + 1
+            return len(queries)
+
+        assert count(nodes[0]) == count(nodes[-1])
+
     def test_create_get(self, client, root):
         """ create should override and add Create operation crumb """
         Type1(node=root, title="Root").save()
@@ -585,6 +717,43 @@ class TestActions(object):
         assert n1.position > n3.position
         assert n3.position > n2.position
 
+    def test_reorder_children(self, client, root):
+        """ apply a complete new order """
+        n1 = root.add("n1")
+        n2 = root.add("n2")
+        n3 = root.add("n3")
+
+        request = superuser_request("/reorder_children", method="POST",
+                                    order=[n3.tree_path, n1.tree_path,
+                                           n2.tree_path])
+        view = MainHandlerTestable()
+        view.dispatch(request, nodepath="", handlerpath="reorder_children")
+
+        assert list(root.children()) == [n3, n1, n2]
+
+    def test_reorder_children_other(self, client, root):
+        """ only children can be reordered """
+        n1 = root.add("n1")
+        n2 = n1.add("n2")
+
+        request = superuser_request("/reorder_children", method="POST",
+                                    order=[n2.tree_path])
+        view = MainHandlerTestable()
+        res = view.dispatch(request, nodepath="",
+                            handlerpath="reorder_children")
+        assert res.status_code == 400
+
+    def test_reorder_children_malformed(self, client, root):
+        """ order values that aren't tree paths are rejected """
+        root.add("n1")
+
+        request = superuser_request("/reorder_children", method="POST",
+                                    order=["garbage"])
+        view = MainHandlerTestable()
+        res = view.dispatch(request, nodepath="",
+                            handlerpath="reorder_children")
+        assert res.status_code == 400
+
 from .fixtures import multilang_ENNL, active_language
 
 @pytest.mark.usefixtures("multilang_ENNL", "active_language",
@@ -6,6 +6,12 @@ from wheelcms_axle.tests.models import Type1Type
 
 from .test_auth import anon_request
 
+def access(check):
+    """ patch the batched permission check with a per spoke check """
+    return mock.patch("wheelcms_axle.auth.has_access_many",
+                      lambda request, spokes, permission=None:
+                          [spoke for spoke in spokes if check(spoke)])
+
 @pytest.mark.usefixtures("localtyperegistry")
 class TestNavigation(object):
     type = Type1Type
@@ -32,7 +38,7 @@ class TestNavigation(object):
     def test_single_child_visible(self, client, root, anon_request):
         """ single accessible child """
         c = Type1Type.create(navigation=True, node=root.add("c1")).save()
-        with mock.patch("wheelcms_axle.auth.has_access", return_value=True):
+        with access(lambda spoke: True):
             res = navigation_items(anon_request, root)
 
             assert len(res['toplevel']) == 1
@@ -41,7 +47,7 @@ class TestNavigation(object):
     def test_single_child_notvisible(self, client, root, anon_request):
         """ single inaccessible child """
         Type1Type.create(navigation=True, node=root.add("c1")).save()
-        with mock.patch("wheelcms_axle.auth.has_access", return_value=False):
+        with access(lambda spoke: False):
             res = navigation_items(anon_request, root)
 
             assert len(res['toplevel']) == 0
@@ -53,7 +59,7 @@ class TestNavigation(object):
         Type1Type.create(navigation=True, node=n1).save()
         c2 = Type1Type.create(navigation=True, node=n1_child).save()
 
-        with mock.patch("wheelcms_axle.auth.has_access", return_value=True):
+        with access(lambda spoke: True):
             res = navigation_items(anon_request, root)
 
             assert len(res['toplevel']) == 1
@@ -68,12 +74,7 @@ class TestNavigation(object):
         Type1Type.create(navigation=True, node=n1).save()
         c2 = Type1Type.create(navigation=True, node=n1_child).save()
 
-        def mocked_has_access(request, type, spoke, perm):
-            if spoke == c2:
-                return False
-            return True
-
-        with mock.patch("wheelcms_axle.auth.has_access", mocked_has_access):
+        with access(lambda spoke: spoke != c2):
             res = navigation_items(anon_request, root)
 
             assert len(res['toplevel']) == 1
@@ -92,7 +93,7 @@ class TestNavigation(object):
         Type1Type.create(navigation=True, node=n2).save()
         Type1Type.create(navigation=True, node=n2_child).save()
 
-        with mock.patch("wheelcms_axle.auth.has_access", return_value=True):
+        with access(lambda spoke: True):
             res = navigation_items(anon_request, n2_child)
 
             assert len(res['toplevel']) == 2
@@ -1,9 +1,16 @@
 from wheelcms_axle.node import Node, DuplicatePathException
 from wheelcms_axle.node import InvalidPathException, CantRenameRoot
 from wheelcms_axle.node import CantMoveToOffspring
-from wheelcms_axle.node import NodeNotFound
+from wheelcms_axle.node import NodeNotFound, Paths
+from wheelcms_axle.node import node_proxy_factory
+from wheelcms_axle.signals import paths_changed
 from .test_urls import Base
 
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+import gc
+import mock
 import pytest
 
 class TestNode(object):
@@ -257,6 +264,62 @@ class TestNode(object):
         assert Node.objects.get(pk=bbb.pk).path == "/aaaa/bbb"
         assert Node.objects.get(pk=bb.pk).path == "/aa/bb"
 
+    def test_rename_signal(self, client, root):
+        """ a rename sends a single paths_changed signal per language """
+        aaa = root.add("aaa")
+        aaa.add("bbb").add("c")
+        received = []
+
+        def handler(sender, **kw):
+            received.append((kw['node'], kw['language'],
+                             kw['oldpath'], kw['newpath']))
+
+        paths_changed.connect(handler)
+        try:
+            aaa.rename("ccc", language="en")
+        finally:
+            paths_changed.disconnect(handler)
+
+        assert received == [(aaa, "en", "/aaa", "/ccc")]
+
+    def test_rename_duplicate_unchanged(self, client, root):
+        """ a failing rename leaves the offspring untouched """
+        aaa = root.add("aaa")
+        bbb = aaa.add("bbb")
+        root.add("ccc")
+        pytest.raises(DuplicatePathException, aaa.rename, "ccc")
+        assert Node.objects.get(pk=bbb.pk).path == "/aaa/bbb"
+
+    def test_ancestors(self, client, root):
+        """ ancestors are returned root first """
+        aaa = root.add("aaa")
+        bbb = aaa.add("bbb")
+        ccc = bbb.add("ccc")
+        assert ccc.ancestors() == [root, aaa, bbb]
+        assert ccc.ancestors(include_self=True) == [root, aaa, bbb, ccc]
+        assert root.ancestors() == []
+        assert root.ancestors(include_self=True) == [root]
+
+    def test_ancestors_prefetched(self, client, root):
+        """ the paths of ancestors are prefetched """
+        aaa = root.add("aaa")
+        bbb = aaa.add("bbb").add("ccc")
+        ancestors = bbb.ancestors(language="en")
+        Paths.objects.all().delete()
+        assert [n.get_path("en") for n in ancestors] == ["", "/aaa", "/aaa/bbb"]
+
+    def test_with_content_urls(self, client, root):
+        """ the urls computed when prefetching are remembered, also
+            when no language is given """
+        root.add("aaa")
+        root.add("bbb")
+        nodes = list(Node.objects.children(root).with_content())
+
+        with mock.patch.object(Node, "_get_absolute_url") as compute:
+            urls = [n.get_absolute_url() for n in nodes]
+        assert urls == ["/aaa/", "/bbb/"]
+        assert not compute.called
+
     def test_remove_single_root(self, client, root):
         """ single, non-recursive removal """
         root.add("aaa")
@@ -364,6 +427,47 @@ class TestNode(object):
 
         assert list(root.children()) == [c4, c1, c3, c2]
 
+    def test_reorder_conflict_respace(self, client, root):
+        """ running out of room respaces all children """
+        c1 = root.add("c1", position=0)
+        c2 = root.add("c2", position=1)
+        c3 = root.add("c3", position=2)
+
+        root.move(c3, after=c1)
+        children = list(root.children())
+        assert children == [c1, c3, c2]
+        assert [c.position for c in children] == \
+               [0, Node.POSITION_INTERVAL // 2, Node.POSITION_INTERVAL]
+
+    def test_reorder_batch(self, client, root):
+        """ apply a complete new order """
+        c1 = root.add("c1")
+        c2 = root.add("c2")
+        c3 = root.add("c3")
+
+        root.reorder([c3, c1.pk, c2])
+        assert list(root.children()) == [c3, c1, c2]
+        assert c3.position < c2.position
+
+    def test_reorder_batch_partial(self, client, root):
+        """ children not mentioned keep their order, others are ignored """
+        c1 = root.add("c1")
+        c2 = root.add("c2")
+        c3 = root.add("c3")
+        other = c1.add("other")
+
+        root.reorder([c3, other])
+        assert list(root.children()) == [c3, c1, c2]
+        assert Node.objects.get(pk=other.pk).position == other.position
+
+    def test_reorder_batch_single_update(self, client, root):
+        c1 = root.add("c1")
+        c2 = root.add("c2")
+        with CaptureQueriesContext(connection) as queries:
+            root.reorder([c2, c1])
+        assert len([q for q in queries.captured_queries
+                    if 'UPDATE' in q['sql']]) == 1
+
     def test_reorder_oddcase1_after(self, client, root):
         """ move after a node where multiple follow """
         c1 = root.add("c1", position=0)
@@ -417,6 +521,20 @@ class TestNodeCopyPaste(Base):
         assert Node.get('/src') is None
         assert res.path == "/target/src"
 
+    def test_move_node_depth(self, client, root):
+        """ moving a node updates the depth of the node and its offspring """
+        src = root.add("src")
+        src_c = src.add("child")
+        target = root.add("target")
+        sub = target.add("sub")
+
+        sub.paste(src)
+
+        assert Node.objects.get(pk=src.pk).depth == 3
+        assert Node.objects.get(pk=src_c.pk).depth == 4
+        assert list(sub.children()) == [src]
+        assert list(Node.get('/target/sub/src').children()) == [src_c]
+
 
     def test_move_inside_offspring(self, client, root):
         """ A node cannot be moved to one of its offspring nodes. """
@@ -474,6 +592,36 @@ class TestNodeCopyPaste(Base):
 
         assert Node.get("/target/src").position > target_child.position
 
+    def test_move_node_result(self, client, root):
+        """ all moved tree_paths are reported as successful """
+        src = root.add("src")
+        src_c = src.add("child")
+        src_cc = src_c.add("child")
+        target = root.add("target")
+
+        res, success, failed = target.paste(src)
+
+        assert failed == []
+        assert set(success) == set(Node.objects.get(pk=n.pk).tree_path
+                                   for n in (src, src_c, src_cc))
+        assert success[-1] == res.tree_path
+
+    def test_move_node_similar_slugs(self, client, root):
+        """ a move only touches the node's own paths, not those that
+            happen to match it as a LIKE pattern """
+        src = root.add("s_c")
+        src_c = src.add("child")
+        other = root.add("sxc")
+        other_c = other.add("child")
+        target = root.add("target")
+
+        target.paste(src)
+
+        assert Node.get('/target/s_c/child') == src_c
+        assert Node.get('/sxc') == other
+        assert Node.get('/sxc/child') == other_c
+        assert Node.objects.get(pk=other_c.pk).tree_path == other_c.tree_path
+
     ## test_copy_root
     ## test_copy_inside -> copy /foo to /foo (resulting in /foo/foo)
 
@@ -565,6 +713,30 @@ class TestNodeCopyPaste(Base):
         assert src_c.parent() == root
         assert src_c.path.startswith('/')
 
+    def test_move_node_duplicate_name_taken(self, client, root):
+        """ numbered candidates are skipped, their offspring ignored """
+        src = root.add("src")
+        src_c = src.add("child")
+        root.add("child").add("deep")
+        root.add("child_0").add("deep")
+        root.add("childish")
+
+        with CaptureQueriesContext(connection) as queries:
+            res, success, failed = root.paste(src_c)
+
+        assert src_c.path == "/child_1"
+        ## the free slug probe doesn't select everything below /child
+        assert not [q for q in queries.captured_queries
+                    if "'/child%'" in q['sql']]
+
+    def test_free_path_batches(self, client, root):
+        """ more numbered candidates are taken than fit in a batch """
+        root.add("child")
+        for i in range(5):
+            root.add("child_%d" % i)
+        assert root._free_path("/child", "en", batch=2) == "/child_5"
+        assert root._free_path("/other", "en", batch=2) == "/other"
+
     def test_copy_node_duplicate_name(self, client, root):
         """ Move a node somewhere where there's already a similar slug """
         # issue #789
@@ -644,3 +816,35 @@ class TestNodeTranslation(Base):
 
         assert child.get_absolute_url(language='en') == '/fooen/'
         assert child.get_absolute_url(language='nl') == '/foonl/'
+
+    def test_language_proxy_reused(self, client, root):
+        """ a language proxy class is created once per language """
+        assert node_proxy_factory(Node, "nl") is node_proxy_factory(Node, "nl")
+        assert node_proxy_factory(Node, "nl") is not \
+               node_proxy_factory(Node, "en")
+        ## proxies are not stacked
+        nl = node_proxy_factory(Node, "nl")
+        assert node_proxy_factory(nl, "nl") is nl
+        assert node_proxy_factory(nl, "en") is node_proxy_factory(Node, "en")
+
+    def test_language_proxy_classes_flat(self, client, root):
+        """ repeatedly querying children doesn't keep creating classes """
+        sub = root.add("sub")
+        root_nl = Node.root(language="nl")
+
+        list(root_nl.children())
+        sub_nl = root_nl.children()[0]
+        sub_nl.parent()
+        gc.collect()
+        types_before = len([o for o in gc.get_objects()
+                            if isinstance(o, type)])
+        proxies_before = len(Node.__subclasses__())
+
+        for i in range(2000):
+            list(root_nl.children())
+            sub_nl.parent()
+
+        gc.collect()
+        assert len(Node.__subclasses__()) == proxies_before
+        assert len([o for o in gc.get_objects()
+                    if isinstance(o, type)]) == types_before
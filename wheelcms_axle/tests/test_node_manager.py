@@ -110,3 +110,27 @@ class TestNodeManager(object):
         c = Node.objects.all().offspring(a)
         assert c.count() == 3
         assert set(n.path for n in c) == set(("/a/a1", "/a/a2", "/a/a1/a11"))
+
+    def test_children_offspring_similar_ids(self, client):
+        """ /1 is not the parent of /10 """
+        root = Node.root()
+        nodes = [root.add("n%d" % i) for i in range(12)]
+        first = nodes[0]
+        first_child = first.add("child")
+        last_child = nodes[-1].add("child")
+
+        assert list(Node.objects.children(first)) == [first_child]
+        assert list(Node.objects.offspring(first)) == [first_child]
+        assert last_child not in Node.objects.offspring(first)
+
+    def test_depth(self, client):
+        """ depth is derived from the tree_path on save """
+        root = Node.root()
+        a = root.add("a")
+        a1 = a.add("a1")
+        a11 = a1.add("a11")
+
+        assert root.depth == 0
+        assert a.depth == 1
+        assert a1.depth == 2
+        assert Node.objects.get(pk=a11.pk).depth == 3
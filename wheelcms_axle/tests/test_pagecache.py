@@ -0,0 +1,167 @@
+import datetime
+import time
+
+import mock
+import pytest
+
+from django.http import HttpResponse
+from django.contrib.auth.models import AnonymousUser, User
+from django.conf import settings
+from django.utils import timezone
+
+from twotest.util import create_request
+
+from wheelcms_axle.main import MainHandler
+from wheelcms_axle.pagecache import page_cache
+from wheelcms_axle.models import Configuration
+from wheelcms_axle.tests.models import Type1, Type1Type
+from .fixtures import active_language
+
+
+class CountingHandler(MainHandler):
+    """ renders a minimal page and counts how often it did """
+    rendered = 0
+
+    def template(self, path, **kw):
+        CountingHandler.rendered += 1
+        return HttpResponse(self.instance.content().title)
+
+
+def anonymous_request(path, headers={}, **data):
+    request = create_request("GET", path, data=data, **headers)
+    request.user = AnonymousUser()
+    return request
+
+@pytest.fixture()
+def page_cache_settings(request):
+    """ enable the page cache, allowing tests to tweak its settings """
+    settings.WHEEL_PAGE_CACHE = True
+
+    def fin():
+        for name in ("WHEEL_PAGE_CACHE", "WHEEL_PAGE_CACHE_STALE"):
+            if hasattr(settings, name):
+                delattr(settings, name)
+    request.addfinalizer(fin)
+    return settings
+
+def fetch(path="/child", headers={}, **data):
+    return CountingHandler().dispatch(anonymous_request(path, headers, **data),
+                                      nodepath=path.strip('/'))
+
+
+@pytest.mark.usefixtures("localtyperegistry", "active_language",
+                         "page_cache_settings")
+class TestPageCache(object):
+    """ anonymous pages are rendered once and invalidated on changes """
+    type = Type1Type
+
+    def setup_method(self, method):
+        CountingHandler.rendered = 0
+
+    def page(self, root, **kw):
+        child = root.add("child")
+        content = Type1(node=child, title="Child", state="published", **kw)
+        content.save()
+        return content
+
+    def test_cached(self, client, root):
+        self.page(root)
+        assert fetch().content == "Child"
+        response = fetch()
+        assert response.content == "Child"
+        assert response['X-Wheel-Cache'] == 'hit'
+        assert CountingHandler.rendered == 1
+
+    def test_conditional(self, client, root):
+        """ cached pages keep their validators """
+        self.page(root)
+        etag = fetch()['ETag']
+        response = fetch(headers=dict(HTTP_IF_NONE_MATCH=etag))
+        assert response.status_code == 304
+        assert page_cache.hits == 1
+
+    def test_disabled(self, client, root, page_cache_settings):
+        page_cache_settings.WHEEL_PAGE_CACHE = False
+        self.page(root)
+        fetch()
+        fetch()
+        assert CountingHandler.rendered == 2
+
+    def test_authenticated(self, client, root):
+        self.page(root)
+        user, _ = User.objects.get_or_create(username="superuser",
+                                             is_superuser=True)
+        for i in range(2):
+            request = create_request("GET", "/child")
+            request.user = user
+            CountingHandler().dispatch(request, nodepath="child")
+        assert CountingHandler.rendered == 2
+
+    def test_query_string(self, client, root):
+        self.page(root)
+        fetch(page="2")
+        fetch(page="2")
+        assert CountingHandler.rendered == 2
+
+    def test_private(self, client, root):
+        """ content anonymous can't view is never stored """
+        child = root.add("child")
+        Type1(node=child, title="Child", state="private").save()
+        assert fetch().status_code == 302
+        assert fetch().status_code == 302
+        assert page_cache.hits == 0
+
+    def test_content_save(self, client, root):
+        content = self.page(root)
+        fetch()
+        content.title = "Changed"
+        content.save()
+        assert fetch().content == "Changed"
+        assert CountingHandler.rendered == 2
+
+    def test_rename(self, client, root):
+        self.page(root)
+        fetch()
+        root.child("child").rename("other")
+        assert fetch("/other").content == "Child"
+        assert CountingHandler.rendered == 2
+
+    def test_assignments_cleared(self, client, root):
+        """ clearing all assignments in the Roles/Perms tab """
+        content = self.page(root)
+        fetch()
+        request = create_request("POST", "/child/+auth", data={})
+        content.spoke().auth(mock.MagicMock(), request, "auth")
+        assert not Type1.objects.get(pk=content.pk).anonymous_view
+        assert fetch().status_code == 302
+        assert page_cache.hits == 0
+
+    def test_configuration(self, client, root):
+        self.page(root)
+        fetch()
+        config = Configuration.config()
+        config.theme = "other"
+        config.save()
+        fetch()
+        assert CountingHandler.rendered == 2
+
+    def test_publication_boundary(self, client, root):
+        """ nothing is kept past an upcoming expiry """
+        self.page(root, expire=timezone.now() + datetime.timedelta(seconds=10))
+        key = page_cache.key(anonymous_request("/child"), "en", "child")
+        fetch()
+        entry = page_cache.backend.get(key)
+        assert entry['stale_until'] - time.time() <= 10
+
+    def test_stale_while_revalidate(self, client, root, page_cache_settings):
+        """ one request regenerates a stale page, others get the old one """
+        page_cache_settings.WHEEL_PAGE_CACHE_STALE = 60
+        self.page(root)
+        key = page_cache.key(anonymous_request("/child"), "en", "child")
+        fetch()
+        entry = page_cache.backend.get(key)
+        entry['fresh_until'] = time.time() - 1
+        page_cache.backend.set(key, entry, 60)
+
+        assert page_cache.get(key) is None
+        assert page_cache.get(key).content == "Child"
@@ -0,0 +1,74 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from wheelcms_axle.node import Node, Paths
+from wheelcms_axle.pathcache import path_cache
+
+class TestPathCache(object):
+    """ verify the path <-> node cache is used and kept in sync """
+    def test_get_single_query(self, client, root):
+        """ Node.get fetches the node along with its path, and fills the
+            cache for get_path """
+        child = root.add("child")
+        path_cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            node = Node.get("/child")
+        assert node == child
+        assert len(queries) == 1
+        assert path_cache.get_path(child.id, "en") == "/child"
+
+    def test_get_path_cached(self, client, root):
+        """ get_path doesn't query Paths once cached """
+        child = root.add("child")
+        assert child.get_path("en") == "/child"
+        Paths.objects.filter(node=child).update(path="/other")
+        assert child.get_path("en") == "/child"
+
+    def test_stats(self, client, root):
+        child = root.add("child")
+        path_cache.clear()
+        path_cache.reset_stats()
+        child.get_path("en")
+        child.get_path("en")
+        assert path_cache.stats() == dict(hits=1, misses=1, ratio=0.5)
+
+    def test_rename_invalidates(self, client, root):
+        """ a rename invalidates the node and its offspring """
+        aaa = root.add("aaa")
+        bbb = aaa.add("bbb")
+        assert Node.get("/aaa/bbb") == bbb
+        assert bbb.get_path() == "/aaa/bbb"
+
+        aaa.rename("ccc")
+        assert Node.get("/aaa/bbb") is None
+        assert Node.get("/ccc/bbb") == bbb
+        assert bbb.get_path() == "/ccc/bbb"
+
+    def test_move_invalidates(self, client, root):
+        """ moving a node invalidates the node and its offspring """
+        src = root.add("src")
+        target = root.add("target")
+        child = src.add("child")
+        assert Node.get("/src/child") == child
+
+        target.paste(src)
+        assert Node.get("/src/child") is None
+        assert Node.get("/target/src/child") == child
+        assert Node.objects.get(pk=child.pk).get_path() == "/target/src/child"
+
+    def test_remove_invalidates(self, client, root):
+        """ removed nodes can't be found through the cache """
+        aaa = root.add("aaa")
+        bbb = aaa.add("bbb")
+        assert Node.get("/aaa/bbb") == bbb
+
+        root.remove("aaa")
+        assert path_cache.get_path(bbb.id, "en") is None
+        assert Node.get("/aaa/bbb") is None
+
+    def test_delete_invalidates(self, client, root):
+        """ deleting a node directly invalidates its paths """
+        aaa = root.add("aaa")
+        assert Node.get("/aaa") == aaa
+        aaa.delete()
+        assert Node.get("/aaa") is None
@@ -0,0 +1,82 @@
+import pytest
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+
+from wheelcms_axle.storage import references, collect_garbage
+from wheelcms_axle.tests.models import BlobFile, BlobFileType
+
+
+def upload(data, name="logo.png"):
+    return SimpleUploadedFile(name, data)
+
+def create(parent, data, name="logo.png"):
+    content = BlobFile(node=parent, storage=upload(data, name))
+    content.save()
+    return content
+
+
+@pytest.mark.usefixtures("localtyperegistry")
+class TestContentAddressedStorage(object):
+    """ identical files are stored once """
+    type = BlobFileType
+
+    def test_hash_named(self, client, root):
+        content = create(root, "data")
+        assert content.storage.name.startswith("blobs/")
+        assert content.storage.name.endswith(".png")
+        assert content.filename == "logo.png"
+        assert content.content_type == "image/png"
+        assert content.storage.read() == "data"
+
+    def test_deduplicate(self, client, root):
+        one = create(root.add("one"), "data", "one.png")
+        two = create(root.add("two"), "data", "two.png")
+        other = create(root.add("other"), "other")
+        assert one.storage.name == two.storage.name
+        assert one.storage.name != other.storage.name
+        assert two.filename == "two.png"
+        assert references(one.storage.name) == 2
+
+    def test_delete_referenced(self, client, root):
+        """ a blob stays as long as anything refers to it """
+        one = create(root.add("one"), "data")
+        two = create(root.add("two"), "data")
+        name = one.storage.name
+        storage = one.storage.storage
+
+        one.delete()
+        assert storage.exists(name)
+        two.delete()
+        assert not storage.exists(name)
+
+    def test_copy_shares_blob(self, client, root):
+        one = create(root.add("one"), "data")
+        target = root.add("target")
+        target.paste(one.node, copy=True)
+        copied = target.children()[0].content()
+        assert copied.storage.name == one.storage.name
+        assert references(one.storage.name) == 2
+
+    def test_collect_garbage(self, client, root):
+        one = create(root.add("one"), "data")
+        kept = create(root.add("two"), "kept")
+        name = one.storage.name
+        storage = one.storage.storage
+
+        ## bulk removal doesn't release blobs
+        root.child("one").delete_subtree()
+        assert storage.exists(name)
+
+        assert name in collect_garbage(storage, dry_run=True)
+        assert storage.exists(name)
+        collect_garbage(storage)
+        assert not storage.exists(name)
+        assert storage.exists(kept.storage.name)
+
+    def test_command(self, client, root):
+        one = create(root.add("one"), "data")
+        name = one.storage.name
+        root.child("one").delete_subtree()
+        call_command('collectblobs', verbose=False)
+        assert not one.storage.storage.exists(name)
@@ -1,4 +1,5 @@
-from wheelcms_axle.node import Node, DuplicatePathException
+from wheelcms_axle.node import Node, Paths, DuplicatePathException
+from wheelcms_axle.node import backfill_paths
 from django.utils import translation
 from .fixtures import multilang_ENNLFR, active_language
 
@@ -304,6 +305,43 @@ class TestNode(object):
         assert Node.get("/target/src/en", language="en") is not None
         assert Node.get("/target/src", language="en") != src
 
+@pytest.mark.usefixtures("multilang_ENNLFR", "active_language")
+class TestBackfillPaths(object):
+    """ a language enabled after nodes have been created has no paths """
+    def test_missing_path_read_only(self, client):
+        """ a missing path falls back without writing """
+        root = Node.root()
+        child = root.add(langslugs=dict(en="child", nl="kind", fr="enfant"))
+        Paths.objects.filter(language="fr").delete()
+
+        assert child.get_path("fr") == "/child"
+        assert not Paths.objects.filter(language="fr").exists()
+
+    def test_backfill(self, client):
+        root = Node.root()
+        child = root.add(langslugs=dict(en="child", nl="kind", fr="enfant"))
+        grandchild = child.add("grandchild")
+        Paths.objects.filter(language="fr").delete()
+
+        created, conflicts = backfill_paths("fr", chunksize=2)
+        assert created == 3
+        assert conflicts == []
+        assert Node.get("", language="fr") == root
+        assert Node.get("/child", language="fr") == child
+        assert Node.get("/child/grandchild", language="fr") == grandchild
+
+        assert backfill_paths("fr") == (0, [])
+
+    def test_backfill_conflict(self, client):
+        """ paths in use aren't overwritten """
+        root = Node.root()
+        child = root.add(langslugs=dict(en="child", nl="kind", fr="enfant"))
+        other = root.add(langslugs=dict(en="other", nl="ander", fr="child"))
+        Paths.objects.filter(language="fr", node=child).delete()
+
+        assert backfill_paths("fr") == (0, [(child.pk, "/child")])
+        assert Node.get("/child", language="fr") == other
+
 class TestContent(object):
     pass
 
@@ -0,0 +1,112 @@
+import json
+import os
+
+import pytest
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test.client import RequestFactory
+
+from wheelcms_axle.uploads import sniff, StreamingUploadHandler
+from wheelcms_axle.uploads import StreamedUploadedFile
+from wheelcms_axle.tests.models import TestFile, TestFileType
+from wheelcms_axle.tests.models import BlobFile, BlobFileType
+
+from wheelcms_axle.templates import template_registry
+
+from .test_handler import MainHandlerTestable, superuser_request
+
+PNG = "\x89PNG\r\n\x1a\n" + "\x00" * 32
+
+
+def streamed_request(**files):
+    """ a POST request whose uploads are handled by the streaming handler """
+    data = dict((name, SimpleUploadedFile(name + ".dat", content))
+                for (name, content) in files.items())
+    request = RequestFactory().post("/", data=data)
+    request.upload_handlers = [StreamingUploadHandler(request)]
+    return request
+
+
+class TestSniff(object):
+    def test_png(self):
+        assert sniff(PNG) == "image/png"
+
+    def test_pdf(self):
+        assert sniff("%PDF-1.4 ...") == "application/pdf"
+
+    def test_unknown(self):
+        assert sniff("hello world") is None
+
+    def test_zip(self):
+        """ could be a docx, xlsx, ...; leave it to the extension """
+        assert sniff("PK\x03\x04....") is None
+
+
+@pytest.mark.usefixtures("localtyperegistry")
+class TestStreamingUpload(object):
+    """ uploads are staged, hashed and sniffed while being received """
+    types = (TestFileType, BlobFileType)
+
+    def test_streamed(self, client):
+        request = streamed_request(storage=PNG)
+        upload = request.FILES['storage']
+        assert isinstance(upload, StreamedUploadedFile)
+        assert upload.size == len(PNG)
+        assert upload.sniffed_type == "image/png"
+        assert upload.read() == PNG
+        assert os.path.exists(upload.temporary_file_path())
+
+    def test_sniffed_content_type(self, client, root):
+        """ the sniffed type wins over the (misleading) extension """
+        upload = streamed_request(storage=PNG).FILES['storage']
+        content = TestFile(node=root, storage=upload)
+        content.save()
+        assert content.content_type == "image/png"
+
+    def test_moved_into_place(self, client, root):
+        """ upload storages move the staged file in stead of copying it """
+        data = PNG + os.urandom(16)  ## not stored before
+        upload = streamed_request(storage=data).FILES['storage']
+        staged = upload.temporary_file_path()
+        content = BlobFile(node=root, storage=upload)
+        content.save()
+        assert not os.path.exists(staged)
+        assert content.storage.read() == data
+
+    def test_hash_reused(self, client, root):
+        import hashlib
+        upload = streamed_request(storage=PNG).FILES['storage']
+        content = BlobFile(node=root, storage=upload)
+        content.save()
+        assert hashlib.sha1(PNG).hexdigest() in content.storage.name
+
+
+@pytest.mark.usefixtures("localtyperegistry", "localtemplateregistry")
+class TestMultiUpload(object):
+    """ several files can be uploaded in a single request """
+    type = TestFileType
+
+    def upload(self, root, *files):
+        template_registry.register(self.type, "foo/bar", "foo bar",
+                                   default=True)
+        request = superuser_request("/fileup", method="POST",
+                                    type=TestFile.get_name(),
+                                    state="published",
+                                    storage=list(files))
+        handler = MainHandlerTestable()
+        response = handler.dispatch(request, nodepath="",
+                                    handlerpath="fileup")
+        return json.loads(response.content)
+
+    def test_single(self, client, root):
+        result = self.upload(root, SimpleUploadedFile("one.txt", "one"))
+        assert result['status'] == "ok"
+        assert result['path'] == "/one-txt/"
+
+    def test_multiple(self, client, root):
+        result = self.upload(root, SimpleUploadedFile("one.txt", "one"),
+                                   SimpleUploadedFile("two.txt", "two"))
+        assert result['status'] == "ok"
+        assert len(result['paths']) == 2
+        titles = sorted(c.content().title for c in root.children())
+        assert titles == ["one.txt", "two.txt"]
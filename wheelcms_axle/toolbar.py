@@ -231,7 +231,7 @@ class Toolbar(object):
 
         for (lang, langtitle) in translate.languages():
             option = dict(id=lang, language=langtitle)
-            content = self.instance.content(language=lang)
+            content = self.instance.prefetched().content(language=lang)
 
             ## In view mode toch edit tonen om vertaling te maken!
             base_url = "switch_admin_language?path=" + self.instance.tree_path + "&switchto=" + lang
@@ -0,0 +1,114 @@
+"""
+    Streaming upload handling
+
+    Enable it with
+
+        FILE_UPLOAD_HANDLERS = ('wheelcms_axle.uploads.StreamingUploadHandler',)
+
+    Uploads are then written, chunk by chunk, to a staging directory inside
+    MEDIA_ROOT (WHEEL_UPLOAD_STAGING, default MEDIA_ROOT/.uploads) while
+    being hashed and having their mimetype sniffed. FileContent uses the
+    sniffed mimetype and the content addressed storage reuses the hash.
+
+    Since the staged file lives on the same filesystem as MEDIA_ROOT, the
+    storages in wheelcms_axle.storage (e.g. DEFAULT_FILE_STORAGE =
+    'wheelcms_axle.storage.UploadFileSystemStorage') save it with a
+    rename in stead of a copy.
+"""
+import errno
+import hashlib
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+
+## (offset, signature, mimetype)
+SIGNATURES = (
+    (0, "\x89PNG\r\n\x1a\n", "image/png"),
+    (0, "\xff\xd8\xff", "image/jpeg"),
+    (0, "GIF87a", "image/gif"),
+    (0, "GIF89a", "image/gif"),
+    (0, "%PDF-", "application/pdf"),
+    (0, "PK\x03\x04", "application/zip"),
+    (0, "\x1f\x8b", "application/x-gzip"),
+    (0, "BM", "image/bmp"),
+    (0, "II*\x00", "image/tiff"),
+    (0, "MM\x00*", "image/tiff"),
+    (0, "ID3", "audio/mpeg"),
+    (0, "OggS", "audio/ogg"),
+    (4, "ftyp", "video/mp4"),
+)
+
+def sniff(data):
+    """ the mimetype of data based on its first bytes, if recognized """
+    for offset, signature, mimetype in SIGNATURES:
+        if data[offset:offset + len(signature)] == signature:
+            if mimetype == "application/zip":
+                ## office documents are zipfiles too, let the
+                ## extension decide
+                return None
+            return mimetype
+    return None
+
+
+def staging_dir():
+    staging = getattr(settings, 'WHEEL_UPLOAD_STAGING', None) or \
+              os.path.join(settings.MEDIA_ROOT, ".uploads")
+    if not os.path.isdir(staging):
+        try:
+            os.makedirs(staging)
+        except OSError, e:
+            if e.errno != errno.EEXIST:
+                raise
+    return staging
+
+
+class StreamedUploadedFile(UploadedFile):
+    """
+        An upload staged on disk, along with its sha1 digest and sniffed
+        mimetype. Like django's TemporaryUploadedFile it provides
+        temporary_file_path() so storages can move it into place.
+    """
+    def __init__(self, name, content_type, charset, dir=None):
+        file = tempfile.NamedTemporaryFile(suffix='.upload',
+                                           dir=dir or staging_dir())
+        super(StreamedUploadedFile, self).__init__(file, name, content_type,
+                                                   0, charset)
+        self.sha1 = None
+        self.sniffed_type = None
+
+    def temporary_file_path(self):
+        return self.file.name
+
+    def close(self):
+        try:
+            return self.file.close()
+        except OSError, e:
+            ## ENOENT: the storage has moved it into place
+            if e.errno != errno.ENOENT:
+                raise
+
+
+class StreamingUploadHandler(FileUploadHandler):
+    """ stage, hash and sniff uploads in a single pass """
+    def new_file(self, *args, **kwargs):
+        super(StreamingUploadHandler, self).new_file(*args, **kwargs)
+        self.file = StreamedUploadedFile(self.file_name, self.content_type,
+                                         self.charset)
+        self.hash = hashlib.sha1()
+        self.head = ""
+
+    def receive_data_chunk(self, raw_data, start):
+        if len(self.head) < 16:
+            self.head += raw_data[:16]
+        self.hash.update(raw_data)
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        self.file.seek(0)
+        self.file.size = file_size
+        self.file.sha1 = self.hash.hexdigest()
+        self.file.sniffed_type = sniff(self.head)
+        return self.file
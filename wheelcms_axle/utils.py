@@ -2,6 +2,12 @@ import json as jsonlib
 from django.http import HttpResponse
 from django.conf import settings
 
+try:
+    from django.db.transaction import atomic
+except ImportError:
+    ## attempt to support Django 1.4 / 1.5
+    from django.db.transaction import commit_on_success as atomic
+
 from wheelcms_axle import translate
 from wheelcms_axle import locale
 
@@ -23,6 +29,13 @@ def get_active_language():
         lang = settings.FALLBACK
     return lang
 
+def chunked(seq, size):
+    """ split a sequence into lists of at most 'size' items, e.g. to keep
+        the number of query parameters within database limits """
+    seq = list(seq)
+    for i in range(0, len(seq), size):
+        yield seq[i:i + size]
+
 def generate_slug(name, language="en", max_length=100,
                   allowed="abcdefghijklmnopqrstuvwxyz0123456789_-",
                   default="slug"):
@@ -64,17 +77,20 @@ def applyrequest(f=None, **kw):
 
 def applyrequest_notype(f, **mapping):
     ## XXX positional arguments don't work, see reset.py -> process
+    ## the argument names don't change, look them up only once
+    vars = f.func_code.co_varnames[:f.func_code.co_argcount]
+
     def applicator(self, *args, **kw):
         ##
         ## Improvements: figure out which arguments don't
         ## have defaults, provide proper error if missing
-        request = self.request
-        vars = f.func_code.co_varnames[:f.func_code.co_argcount]
+        ## REQUEST builds a new MergeDict on every access
+        data = self.request.REQUEST
         args = args[:]
         kw = kw.copy()
         for k in vars:
             try:
-                v = request.REQUEST[k]
+                v = data[k]
                 if k in mapping:
                     v = mapping[k](v)
                 kw[k] = v